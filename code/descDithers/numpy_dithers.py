@@ -0,0 +1,343 @@
+# Standalone (numpy-only) implementation of the DESC dithers, so that they can be
+# calculated without the sims_maf stack. See save_csv_dithers for how they're used.
+#
+##########################################################################################
+import numpy as np
+
+__all__= ['wrap_ra_dec', 'in_hexagon', 'random_hexagon_offsets',
+          'random_dither_field_per_visit', 'apply_field_offsets', 'FieldDitherStream',
+          'random_rot_dither_per_filter_change', 'RotDitherStream']
+
+def wrap_ra_dec(ra, dec):
+    """
+
+    Wrap RA into [0, 2pi) and Dec into [-pi/2, pi/2]; same as wrapRADec in MAF.
+    Dec is wrapped in place.
+
+    Required Inputs
+    ---------------
+    * ra: np.array: RA in radians.
+    * dec: np.array: Dec in radians.
+
+    Returns: ra, dec
+
+    """
+    low = np.where(dec < -np.pi/2.)[0]
+    dec[low] = -1*(np.pi + dec[low])
+    ra[low] = ra[low] - np.pi
+    high = np.where(dec > np.pi/2.)[0]
+    dec[high] = np.pi - dec[high]
+    ra[high] = ra[high] - np.pi
+    ra = ra % (2.*np.pi)
+    return ra, dec
+
+def in_hexagon(xOff, yOff, maxDither):
+    """
+
+    Find the offsets that lie inside the hexagon inscribed in a circle of radius
+    maxDither (with flat top/bottom); same as inHexagon in MAF.
+
+    Returns: np.array of the indices of the offsets that are inside.
+
+    """
+    # y = mx + b; 2h is the height.
+    m = np.sqrt(3.)
+    b = m*maxDither
+    h = m/2.*maxDither
+    inside = np.where((yOff < h) & (yOff > -h) &
+                      (yOff < m*xOff + b) & (yOff > m*xOff - b) &
+                      (yOff < -m*xOff + b) & (yOff > -m*xOff - b))[0]
+    return inside
+
+def random_hexagon_offsets(noffsets, maxDither, rng, maxTries=100):
+    """
+
+    Draw random offsets uniformly within the hexagon of size maxDither, in the same
+    way (and in the same order of draws from rng) as the MAF dither stackers: 2*noffsets
+    radii and then 2*noffsets angles are drawn, the points outside the hexagon dropped,
+    and this repeated until there are enough.
+
+    Required Inputs
+    ---------------
+    * noffsets: int: number of offsets to draw.
+    * maxDither: float: radius of the circle around the hexagon.
+    * rng: np.random.RandomState: the random number generator to draw from.
+
+    Optional Inputs
+    ---------------
+    * maxTries: int: maximum number of times to draw 2*noffsets points.
+                     Default: 100
+
+    Returns: xOff, yOff (in the units of maxDither)
+
+    """
+    xOut = np.array([], float)
+    yOut = np.array([], float)
+    tries = 0
+    while (len(xOut) < noffsets) and (tries < maxTries):
+        dithersRad = np.sqrt(rng.rand(noffsets*2))*maxDither
+        dithersTheta = rng.rand(noffsets*2)*np.pi*2.
+        xOff = dithersRad*np.cos(dithersTheta)
+        yOff = dithersRad*np.sin(dithersTheta)
+        idx = in_hexagon(xOff, yOff, maxDither)
+        xOut = np.concatenate([xOut, xOff[idx]])
+        yOut = np.concatenate([yOut, yOff[idx]])
+        tries += 1
+    if len(xOut) < noffsets:
+        raise ValueError('Could not find enough random points within the hexagon in %d tries. '
+                         'Try another random seed?'%maxTries)
+    return xOut[0:noffsets], yOut[0:noffsets]
+
+def random_dither_field_per_visit(fieldRA, fieldDec, maxDither=1.75, degrees=True,
+                                  randomSeed=42):
+    """
+
+    Add a random offset within a hexagon to each visit; gives the same positions as
+    MAF's RandomDitherFieldPerVisitStacker with the same maxDither and randomSeed.
+
+    Required Inputs
+    ---------------
+    * fieldRA: np.array: RA of the field centers.
+    * fieldDec: np.array: Dec of the field centers.
+
+    Optional Inputs
+    ---------------
+    * maxDither: float: radius (in degrees) of the circle around the dither hexagon.
+                        Default: 1.75
+    * degrees: bool: set to False if fieldRA, fieldDec are in radians (as in V3 outputs).
+                     Default: True
+    * randomSeed: int: seed for the random number generator.
+                       Default: 42
+
+    Returns: ditheredRA, ditheredDec, in the units of fieldRA, fieldDec
+
+    """
+    rng = np.random.RandomState(randomSeed)
+    xOff, yOff = random_hexagon_offsets(len(fieldRA), np.radians(maxDither), rng)
+    return apply_field_offsets(fieldRA, fieldDec, xOff, yOff, degrees=degrees)
+
+def apply_field_offsets(fieldRA, fieldDec, xOff, yOff, degrees=True):
+    """
+
+    Add offsets (in radians) to field positions, scaling the RA offsets by 1/cos(Dec),
+    and wrap the results into the RA, Dec range.
+
+    Returns: ditheredRA, ditheredDec, in the units of fieldRA, fieldDec
+
+    """
+    if degrees:
+        ra, dec = np.radians(fieldRA), np.radians(fieldDec)
+    else:
+        ra, dec = fieldRA, fieldDec
+    ditheredRA, ditheredDec = wrap_ra_dec(ra + xOff/np.cos(dec), dec + yOff)
+    if degrees:
+        ditheredRA, ditheredDec = np.degrees(ditheredRA), np.degrees(ditheredDec)
+    return ditheredRA, ditheredDec
+
+def _skip_draws(rng, ndraws, blockSize=2**20):
+    """
+
+    Advance rng by ndraws uniform draws, in blocks of at most blockSize.
+
+    """
+    for start in range(0, ndraws, blockSize):
+        rng.rand(min(blockSize, ndraws - start))
+
+class FieldDitherStream:
+    """
+
+    Random per-visit dithers within a hexagon for visits that come in chunks. The
+    dithers are the same as from random_dither_field_per_visit on all the visits at
+    once (and so as from RandomDitherFieldPerVisitStacker), whatever the chunk sizes,
+    but only the offsets for the current chunk are kept in memory.
+
+    This is possible since random_hexagon_offsets draws its radii and angles from
+    separate, known stretches of the random sequence: the radii for the first try are
+    draws [0, 2n) and the angles are draws [2n, 4n), etc. Here two RandomStates step
+    through the radii and the angles in parallel.
+
+    Required Inputs
+    ---------------
+    * nvisits: int: total number of visits (over all chunks).
+
+    Optional Inputs
+    ---------------
+    * maxDither: float: radius (in degrees) of the circle around the dither hexagon.
+                        Default: 1.75
+    * degrees: bool: set to False if fieldRA, fieldDec are in radians (as in V3 outputs).
+                     Default: True
+    * randomSeed: int: seed for the random number generator.
+                       Default: 42
+    * maxTries: int: maximum number of times to draw 2*nvisits points.
+                     Default: 100
+
+    """
+    def __init__(self, nvisits, maxDither=1.75, degrees=True, randomSeed=42, maxTries=100):
+        self.nvisits = nvisits
+        self.maxDither = np.radians(maxDither)
+        self.degrees = degrees
+        self.maxTries = maxTries
+        self._radRng = np.random.RandomState(randomSeed)
+        self._thetaRng = np.random.RandomState(randomSeed)
+        _skip_draws(self._thetaRng, 2*nvisits)
+        self._tries = 1
+        self._drawn = 0      # number of points drawn in the current try
+        self._returned = 0   # number of offsets returned
+        self._xBuf = np.array([], float)
+        self._yBuf = np.array([], float)
+
+    def _offsets(self, count):
+        """
+
+        Return the next count offsets (in radians).
+
+        """
+        if self._returned + count > self.nvisits:
+            raise ValueError('Asked for dithers for more than the %d visits.'%self.nvisits)
+        xOut, yOut = [self._xBuf], [self._yBuf]
+        have = len(self._xBuf)
+        while have < count:
+            if self._drawn == 2*self.nvisits:
+                if self._tries == self.maxTries:
+                    raise ValueError('Could not find enough random points within the hexagon in %d tries. '
+                                     'Try another random seed?'%self.maxTries)
+                # the radii for the next try follow the angles for this one.
+                _skip_draws(self._radRng, 2*self.nvisits)
+                _skip_draws(self._thetaRng, 2*self.nvisits)
+                self._tries += 1
+                self._drawn = 0
+            # about 83% of the points are inside the hexagon
+            ndraw = min(2*self.nvisits - self._drawn, int(1.25*(count - have)) + 64)
+            dithersRad = np.sqrt(self._radRng.rand(ndraw))*self.maxDither
+            dithersTheta = self._thetaRng.rand(ndraw)*np.pi*2.
+            xOff = dithersRad*np.cos(dithersTheta)
+            yOff = dithersRad*np.sin(dithersTheta)
+            idx = in_hexagon(xOff, yOff, self.maxDither)
+            xOut.append(xOff[idx])
+            yOut.append(yOff[idx])
+            have += len(idx)
+            self._drawn += ndraw
+        xOut, yOut = np.concatenate(xOut), np.concatenate(yOut)
+        self._xBuf, self._yBuf = xOut[count:], yOut[count:]
+        self._returned += count
+        return xOut[:count], yOut[:count]
+
+    def dither(self, fieldRA, fieldDec):
+        """
+
+        Dither the next chunk of visits.
+
+        Returns: ditheredRA, ditheredDec, in the units of fieldRA, fieldDec
+
+        """
+        xOff, yOff = self._offsets(len(fieldRA))
+        return apply_field_offsets(fieldRA, fieldDec, xOff, yOff, degrees=self.degrees)
+
+def random_rot_dither_per_filter_change(rotTelPos, filters, degrees=True,
+                                        maxRotAngle=90., minRotAngle=-90.,
+                                        randomSeed=42, maxTrials=100):
+    """
+
+    Add a random rotational offset, between minRotAngle and maxRotAngle, to rotTelPos
+    after every filter change (including the first visit). Visits for which the dithered
+    rotTelPos would be outside the rotator range get a new offset, drawn up to maxTrials
+    times until one is inside the range; visits for which none is are left undithered.
+
+    The random draws are made in the same order as in the RandomRotDitherPerFilterChangeStacker
+    used for the DESC dithers (see readme.md), from a single RandomState(randomSeed): first one
+    offset per filter change, then, in each of up to maxTrials rounds, one new offset for each
+    visit that is still out of range, in visit order.
+
+    Required Inputs
+    ---------------
+    * rotTelPos: np.array: undithered rotator positions.
+    * filters: np.array: filter of each visit.
+
+    Optional Inputs
+    ---------------
+    * degrees: bool: set to False if rotTelPos is in radians (as in V3 outputs).
+                     Default: True
+    * maxRotAngle: float: upper edge of the rotator range (and of the offsets), in degrees.
+                          Default: 90
+    * minRotAngle: float: lower edge of the rotator range (and of the offsets), in degrees.
+                          Default: -90
+    * randomSeed: int: seed for the random number generator.
+                       Default: 42
+    * maxTrials: int: maximum number of rounds of new offsets for out-of-range visits.
+                      Default: 100
+
+    Returns: ditheredRotTelPos, in the units of rotTelPos
+
+    """
+    stream = RotDitherStream(degrees=degrees, maxRotAngle=maxRotAngle, minRotAngle=minRotAngle,
+                             randomSeed=randomSeed, maxTrials=maxTrials)
+    return stream.dither(rotTelPos, filters)
+
+class RotDitherStream:
+    """
+
+    Rotational dithers (see random_rot_dither_per_filter_change) for visits that come in
+    chunks, in time order. The filter of the last visit, the offset for it, and the random
+    number generator are carried over to the next chunk. Each chunk's offsets (and then its
+    redraws) are drawn before the next chunk's, so the dithers are the same as from
+    random_rot_dither_per_filter_change only when all the visits are in one chunk; with
+    several chunks they follow the same rules but depend on the chunk sizes. Inputs are as
+    for random_rot_dither_per_filter_change.
+
+    """
+    def __init__(self, degrees=True, maxRotAngle=90., minRotAngle=-90., randomSeed=42,
+                 maxTrials=100):
+        self.degrees = degrees
+        self.maxRot, self.minRot = np.radians(maxRotAngle), np.radians(minRotAngle)
+        self.maxTrials = maxTrials
+        self._rng = np.random.RandomState(randomSeed)
+        self._lastFilter = None
+        self._lastOffset = None
+
+    def dither(self, rotTelPos, filters):
+        """
+
+        Dither the next chunk of visits.
+
+        Returns: ditheredRotTelPos, in the units of rotTelPos
+
+        """
+        maxRot, minRot = self.maxRot, self.minRot
+        if self.degrees:
+            rot = np.radians(rotTelPos)
+        else:
+            rot = np.array(rotTelPos, dtype=float)
+        if len(rot)==0:
+            return rot
+        # rotTelPos is in [0, 2pi) in some outputs
+        rot[rot > np.pi] -= 2.*np.pi
+
+        # one offset per run of visits in the same filter, continuing the last chunk's run
+        filters = np.asarray(filters)
+        isChange = np.ones(len(filters), dtype=bool)
+        isChange[1:] = filters[1:] != filters[:-1]
+        if self._lastFilter is not None:
+            isChange[0] = filters[0] != self._lastFilter
+        changeOffsets = self._rng.rand(np.count_nonzero(isChange))*(maxRot - minRot) + minRot
+        if not isChange[0]:
+            changeOffsets = np.concatenate([[self._lastOffset], changeOffsets])
+            rotOffset = changeOffsets[np.cumsum(isChange)]
+        else:
+            rotOffset = changeOffsets[np.cumsum(isChange) - 1]
+        self._lastFilter, self._lastOffset = filters[-1], changeOffsets[-1]
+
+        # redraw the offsets that take the rotator out of its range, as the stacker does
+        badIdx = np.where((rot + rotOffset < minRot) | (rot + rotOffset > maxRot))[0]
+        tries = 0
+        while (len(badIdx) > 0) and (tries < self.maxTrials):
+            rotOffset[badIdx] = self._rng.rand(len(badIdx))*(maxRot - minRot) + minRot
+            ditheredBad = rot[badIdx] + rotOffset[badIdx]
+            badIdx = badIdx[(ditheredBad < minRot) | (ditheredBad > maxRot)]
+            tries += 1
+        # no dither for the visits for which no offset worked.
+        rotOffset[badIdx] = 0.
+
+        ditheredRot = rot + rotOffset
+        if self.degrees:
+            ditheredRot = np.degrees(ditheredRot)
+        return ditheredRot
@@ -0,0 +1,210 @@
+# Lightweight reader for the visits in OpSim V3/V4 output databases, using sqlite3
+# directly rather than lsst.sims.maf.db. Only the columns needed for the dithers are read.
+#
+##########################################################################################
+import os
+import re
+import sqlite3
+from urllib.request import pathname2url
+import numpy as np
+
+__all__= ['connect_opsim_db', 'opsim_version', 'count_opsim_visits', 'read_opsim_visits',
+          'iter_opsim_visits', 'read_opsim_prop_tags']
+
+# table, time column (to group visits by, as in OpsimDatabase.fetchMetricData), and the
+# columns to read (with the dtypes of the output arrays) for each OpSim version.
+opsim_schemas = {'V4': {'table': 'SummaryAllProps', 'time': 'observationStartMJD',
+                        'columns': [('proposalId', 'i8'), ('observationId', 'i8'),
+                                    ('fieldRA', 'f8'), ('fieldDec', 'f8'), ('rotTelPos', 'f8'),
+                                    ('night', 'i8'), ('filter', 'U1')]},
+                 'V3': {'table': 'Summary', 'time': 'expMJD',
+                        'columns': [('propID', 'i8'), ('obsHistID', 'i8'),
+                                    ('fieldRA', 'f8'), ('fieldDec', 'f8'), ('rotTelPos', 'f8'),
+                                    ('night', 'i8'), ('filter', 'U1')]}}
+
+def connect_opsim_db(dbpath, mmap_size=2**30, temp_store_memory=True):
+    """
+
+    Open an OpSim database read-only, with memory-mapped I/O.
+
+    Required Inputs
+    ---------------
+    * dbpath: str: path to the .db file.
+
+    Optional Inputs
+    ---------------
+    * mmap_size: int: maximum number of bytes of the database to memory map.
+                      Default: 2**30
+    * temp_store_memory: bool: set to False to let sqlite keep temporary data (e.g. for
+                               sorting the visits by time) in files rather than in memory.
+                               Default: True
+
+    Returns: sqlite3.Connection
+
+    """
+    if not os.path.isfile(dbpath):
+        # connecting would otherwise fail with a less helpful message
+        raise IOError('No such database: %s'%dbpath)
+    conn = sqlite3.connect('file:%s?mode=ro'%pathname2url(os.path.abspath(dbpath)), uri=True)
+    conn.execute('PRAGMA query_only = 1')
+    conn.execute('PRAGMA mmap_size = %d'%mmap_size)
+    if temp_store_memory:
+        conn.execute('PRAGMA temp_store = MEMORY')
+    return conn
+
+def opsim_version(conn):
+    """
+
+    Find the OpSim version of a database from its tables, as OpsimDatabase.opsimVersion
+    does: 'V4' if it has a SummaryAllProps table, 'V3' if it has a Summary table.
+
+    """
+    tables = [row[0].lower() for row in
+              conn.execute("SELECT name FROM sqlite_master WHERE type='table'")]
+    if 'summaryallprops' in tables:
+        return 'V4'
+    if 'summary' in tables:
+        return 'V3'
+    raise ValueError('Cannot determine the OpSim version; tables found: %s'%tables)
+
+def _visits_query(schema):
+    """
+
+    SQL query for the visits in schema, grouped and ordered by time as in
+    OpsimDatabase.fetchMetricData.
+
+    """
+    return 'SELECT %s FROM %s GROUP BY %s ORDER BY %s'%(', '.join([col for col, _ in schema['columns']]),
+                                                      schema['table'], schema['time'], schema['time'])
+
+def count_opsim_visits(conn, version=None):
+    """
+
+    Count the visits (distinct start times) in an OpSim database.
+
+    """
+    if version is None: version = opsim_version(conn)
+    schema = opsim_schemas[version]
+    return conn.execute('SELECT COUNT(DISTINCT %s) FROM %s'%(schema['time'],
+                                                             schema['table'])).fetchone()[0]
+
+def read_opsim_visits(conn, version=None, fetch_size=2**16):
+    """
+
+    Read the visits needed for the dithers, in time order, into a numpy structured array.
+    The rows (and their order) are the same as from OpsimDatabase.fetchMetricData with
+    sqlconstraint=None: visits are grouped by their start time, so a V3 visit that counts
+    for several proposals appears once.
+
+    Required Inputs
+    ---------------
+    * conn: sqlite3.Connection: connection to the database (see connect_opsim_db).
+
+    Optional Inputs
+    ---------------
+    * version: str: 'V3' or 'V4'.
+                    Default: None. Found with opsim_version.
+    * fetch_size: int: number of rows to fetch from sqlite at a time.
+                       Default: 2**16
+
+    Returns: np.array with the columns proposalId, observationId, fieldRA, fieldDec,
+             rotTelPos, night, filter for V4 outputs; propID, obsHistID, ... for V3 outputs.
+             Positions are in degrees for V4 outputs and in radians for V3 outputs.
+
+    """
+    if version is None: version = opsim_version(conn)
+    schema = opsim_schemas[version]
+
+    visits = np.empty(count_opsim_visits(conn, version), dtype=np.dtype(schema['columns']))
+    cursor = conn.execute(_visits_query(schema))
+    start = 0
+    while True:
+        rows = cursor.fetchmany(fetch_size)
+        if len(rows)==0: break
+        visits[start:start+len(rows)] = rows
+        start += len(rows)
+    return visits
+
+def iter_opsim_visits(conn, version=None, chunk_size=2**18):
+    """
+
+    Read the same visits as read_opsim_visits, chunk_size visits at a time, so that only
+    one chunk is in memory at a time.
+
+    Required Inputs
+    ---------------
+    * conn: sqlite3.Connection: connection to the database (see connect_opsim_db).
+
+    Optional Inputs
+    ---------------
+    * version: str: 'V3' or 'V4'.
+                    Default: None. Found with opsim_version.
+    * chunk_size: int: number of visits in each chunk.
+                       Default: 2**18
+
+    Returns: generator of np.arrays, as from read_opsim_visits.
+
+    """
+    if version is None: version = opsim_version(conn)
+    schema = opsim_schemas[version]
+    dtype = np.dtype(schema['columns'])
+
+    cursor = conn.execute(_visits_query(schema))
+    while True:
+        rows = cursor.fetchmany(chunk_size)
+        if len(rows)==0: break
+        yield np.array(rows, dtype=dtype)
+
+def read_opsim_prop_tags(conn, version=None):
+    """
+
+    Find the proposal IDs of the WFD and DD proposals, as OpsimDatabase.fetchPropInfo does.
+    V4 proposals are tagged from their names; V3 ones from the ScienceType entries in the
+    Config table or, in older outputs without them, from their names.
+
+    Required Inputs
+    ---------------
+    * conn: sqlite3.Connection: connection to the database (see connect_opsim_db).
+
+    Optional Inputs
+    ---------------
+    * version: str: 'V3' or 'V4'.
+                    Default: None. Found with opsim_version.
+
+    Returns: propIds, propTags: dicts of {proposal ID: name} and {tag: list of proposal IDs}.
+
+    """
+    if version is None: version = opsim_version(conn)
+    propTags = {'WFD': [], 'DD': [], 'NES': []}
+    propIds = {}
+    if version=='V4':
+        for propId, propName in conn.execute('SELECT propId, propName FROM Proposal'):
+            propIds[propId] = propName
+            if 'widefastdeep' in propName.lower():
+                propTags['WFD'].append(propId)
+            if 'deepdrilling' in propName.lower():
+                propTags['DD'].append(propId)
+            if 'northecliptic' in propName.lower():
+                propTags['NES'].append(propId)
+        return propIds, propTags
+
+    for propId, propName in conn.execute('SELECT propID, propConf FROM Proposal'):
+        # strip path info, '.conf', and 'Prop'
+        propIds[propId] = re.sub('Prop', '', re.sub('.conf', '', re.sub('.*/', '', propName)))
+    scienceTypes = conn.execute("SELECT paramValue, nonPropID FROM Config "
+                                "WHERE paramName LIKE 'ScienceType'").fetchall()
+    if len(scienceTypes)==0:
+        # older outputs without ScienceType tags
+        for propId, propName in propIds.items():
+            if 'universal' in propName.lower():
+                propTags['WFD'].append(propId)
+            if 'deep' in propName.lower():
+                propTags['DD'].append(propId)
+            if 'northecliptic' in propName.lower():
+                propTags['NES'].append(propId)
+    else:
+        for paramValue, nonPropID in scienceTypes:
+            # a proposal can have several tags, separated by ','
+            for tag in [x.strip(' ') for x in paramValue.split(',')]:
+                propTags.setdefault(tag, []).append(int(nonPropID))
+    return propIds, propTags
@@ -4,28 +4,26 @@
 # Humna Awan: humna.awan@rutgers.edu
 #
 ##########################################################################################
-import matplotlib
-matplotlib.use('Agg')
-import matplotlib.pyplot as plt
-import lsst.sims.maf
-import lsst.sims.maf.db as db
-import lsst.sims.maf.utils as mafUtils
-import lsst.sims.maf.slicers as slicers
-import lsst.sims.maf.metrics as metrics
-import lsst.sims.maf.metricBundles as metricBundles
-import lsst.sims.maf.stackers as stackers
 import time
+from concurrent.futures import ProcessPoolExecutor
 import pandas as pd
 import os
 import numpy as np
 import datetime
+# lsst.sims.maf and matplotlib are imported only when they're needed, since they're
+# slow to import and dither_engine='numpy' doesn't use the MAF stackers.
+from numpy_dithers import random_dither_field_per_visit, random_rot_dither_per_filter_change
+from numpy_dithers import FieldDitherStream, RotDitherStream
+from opsim_reader import connect_opsim_db, opsim_version, read_opsim_visits, read_opsim_prop_tags
+from opsim_reader import count_opsim_visits, iter_opsim_visits
 
 __all__= ['save_csv_dithers']
 
 def save_csv_dithers(dbs_path, outDir, db_files_only=None,
                      rot_rand_seed=42, trans_rand_seed=42,
                      print_progress=True,
-                     show_diagnostic_plots=False, save_plots=False):
+                     show_diagnostic_plots=False, save_plots=False,
+                     n_workers=1, dither_engine='maf', chunk_size=None):
     """
     
     The goal here is to calculate the translational and rotational dithers for
@@ -63,6 +61,23 @@ def save_csv_dithers(dbs_path, outDir, db_files_only=None,
                                    Default: False
     * save_plots: bool: set to True to save the histogram for descDithers in outDir.
                         Default: False
+    * n_workers: int: number of processes over which to distribute the db files. The
+                      dithers (and seeds) for each file are the same as in a serial run,
+                      and the readme is written in the same order.
+                      Default: 1
+    * dither_engine: str: 'maf' to calculate the dithers with the MAF stackers; 'numpy' to
+                          read the database with sqlite3 (see opsim_reader) and calculate them
+                          with numpy_dithers, without lsst.sims.maf. The dithers are drawn in
+                          the same order as by the stackers, with the same seeds.
+                          Default: 'maf'
+    * chunk_size: int: number of visits to read, dither, and write to the csv file at a
+                       time, so that the memory needed doesn't grow with the number of
+                       visits. Requires dither_engine='numpy'. The translational dithers
+                       are the same as without it; the rotational ones follow the same rules,
+                       but the stacker redraws out-of-range offsets over all the visits at
+                       once, so with chunks they depend on chunk_size. Can't be used with
+                       the plots.
+                       Default: None. All visits are processed at once.
                                    
     Saved file format
     -----------------
@@ -76,12 +91,21 @@ def save_csv_dithers(dbs_path, outDir, db_files_only=None,
     """
     startTime_0 = time.time()
     readme = '##############################\n%s'%(datetime.date.isoformat(datetime.date.today()))
-    readme += '\nRunning with lsst.sims.maf.__version__: %s'%lsst.sims.maf.__version__
+    if dither_engine not in ['maf', 'numpy']:
+        raise ValueError('Unknown dither_engine: %s. Must be maf or numpy.'%dither_engine)
+    if dither_engine=='maf':
+        import lsst.sims.maf
+        readme += '\nRunning with lsst.sims.maf.__version__: %s'%lsst.sims.maf.__version__
+    else:
+        readme += '\nRunning with numpy.__version__: %s'%np.__version__
     readme += '\n\nsave_csv_dithers run:\ndbs_path= %s\n'%dbs_path
     readme += 'outDir: %s'%outDir
     readme += 'db_files_only: %s'%db_files_only
     readme += 'rot_rand_seed=%s\ntrans_rand_seed=%s'%(rot_rand_seed, trans_rand_seed)
     readme += 'print_progress=%s\show_diagnostic_plots=%s\n'%(print_progress, show_diagnostic_plots)
+    readme += 'n_workers=%s\n'%n_workers
+    readme += 'dither_engine=%s\n'%dither_engine
+    readme += 'chunk_size=%s\n'%chunk_size
 
     dbfiles = [f for f in os.listdir(dbs_path) if f.endswith('db')]  # select db files
     if print_progress: print('Found files: %s\n'%dbfiles)
@@ -92,201 +116,349 @@ def save_csv_dithers(dbs_path, outDir, db_files_only=None,
     readme += '\nReading for files: %s\n\n'%dbfiles
     if print_progress and db_files_only is not None: print('Running over: %s\n'%dbfiles)
     
-    for i, dbfile in enumerate(dbfiles): # loop over all the db files
-        startTime = time.time()
+    if n_workers > 1 and show_diagnostic_plots:
+        raise ValueError('show_diagnostic_plots requires n_workers=1.')
+    if chunk_size is not None and dither_engine!='numpy':
+        raise ValueError('chunk_size requires dither_engine=numpy.')
+    if chunk_size is not None and (show_diagnostic_plots or save_plots):
+        raise ValueError('chunk_size cannot be used with show_diagnostic_plots or save_plots.')
+
+    # arguments for each db file; each is processed independently.
+    db_args = [(dbs_path, dbfile, outDir, rot_rand_seed, trans_rand_seed, print_progress,
+                show_diagnostic_plots, save_plots, dither_engine, chunk_size) for dbfile in dbfiles]
+    if n_workers > 1 and len(dbfiles) > 0:
+        with ProcessPoolExecutor(max_workers=min(n_workers, len(dbfiles))) as pool:
+            # map returns the results in the order of dbfiles, so the readme is deterministic.
+            totalDbTime = _write_readme_entries(outDir, readme,
+                                                pool.map(_save_csv_dithers_for_db, *zip(*db_args)))
+    else:
+        totalDbTime = _write_readme_entries(outDir, readme,
+                                            (_save_csv_dithers_for_db(*args) for args in db_args))
+
+    # mark the end in the readme.
+    readme_file= open('%s/readme.txt'%(outDir), 'a')
+    if n_workers > 1:
+        readme_file.write('Ran with %s workers; time taken summed over files: %.2f (min)\n'%(n_workers,
+                                                                                             totalDbTime/60.))
+    readme_file.write('All done. Total time taken: %.2f (min)\n\n'%((time.time()-startTime_0)/60.))
+    readme_file.close()
+
+
+def _write_readme_entries(outDir, readme, results):
+    """
+
+    Append the readme entry for each db file to readme.txt as its results come in, after
+    the header in readme. Returns the time taken summed over the db files.
+
+    """
+    totalDbTime = 0.
+    for i, (db_readme, db_time) in enumerate(results): # loop over all the db files
         if (i!=0): readme = ''
-        readme += '%s'%dbfile
+        readme += db_readme
+        totalDbTime += db_time
 
-        if print_progress: print('Starting: %s\n'%dbfile)
-            
-        opsdb = db.OpsimDatabase('%s/%s'%(dbs_path, dbfile)) # connect to the database
+        readme_file= open('%s/readme.txt'%(outDir), 'a')
+        readme_file.write(readme)
+        readme_file.close()
+    return totalDbTime
+
+def _save_csv_dithers_for_db(dbs_path, dbfile, outDir, rot_rand_seed, trans_rand_seed,
+                             print_progress, show_diagnostic_plots, save_plots, dither_engine,
+                             chunk_size=None):
+    """
+
+    Calculate and save the dithers for one db file; see save_csv_dithers for the inputs.
+    Returns the readme text for the file and the time taken (in seconds).
+
+    """
+    if chunk_size is not None:
+        return _save_csv_dithers_chunked(dbs_path, dbfile, outDir, rot_rand_seed, trans_rand_seed,
+                                         print_progress, chunk_size)
+
+    startTime = time.time()
+    readme = '%s'%dbfile
+
+    if print_progress: print('Starting: %s\n'%dbfile)
         
-        # specify the column names to get from the db file
-        colnames = ['proposalId', 'observationId', 'fieldRA', 'fieldDec', 'rotTelPos']
-        propIDcol, obsIDcol= 'proposalId', 'observationId'
+    if show_diagnostic_plots or save_plots:
+        import matplotlib
+        matplotlib.use('Agg')
+        import matplotlib.pyplot as plt
+
+    if dither_engine=='maf':
+        import lsst.sims.maf.db as db
+        opsdb = db.OpsimDatabase('%s/%s'%(dbs_path, dbfile)) # connect to the database
+        opsimVersion, raDecInDeg = opsdb.opsimVersion, opsdb.raDecInDeg
+    else:
+        # read the database directly with sqlite3.
+        conn = connect_opsim_db('%s/%s'%(dbs_path, dbfile))
+        opsimVersion = opsim_version(conn)
+        raDecInDeg = (opsimVersion=='V4')
+    
+    # specify the column names to get from the db file; filter is needed for the rotational dithers.
+    colnames = ['proposalId', 'observationId', 'fieldRA', 'fieldDec', 'rotTelPos', 'filter']
+    propIDcol, obsIDcol= 'proposalId', 'observationId'
+    
+    if (opsimVersion=='V3'):
+        # V3 outputs have somewhat different column names
+        colnames = ['propID', 'obsHistID', 'fieldRA', 'fieldDec', 'rotTelPos', 'filter']
+        propIDcol, obsIDcol= 'propID', 'obsHistID'
         
-        if (opsdb.opsimVersion=='V3'):
-            # V3 outputs have somewhat different column names
-            colnames = ['propID', 'obsHistID', 'fieldRA', 'fieldDec', 'rotTelPos']
-            propIDcol, obsIDcol= 'propID', 'obsHistID'
-            
-        # get the data
+    # get the data. this is the only read of the database: the stackers are run directly
+    # on simdata, in the same order (and with the same seeds) as a MetricBundleGroup would
+    # run them on the data it fetches.
+    if dither_engine=='maf':
         simdata = opsdb.fetchMetricData(colnames=colnames, sqlconstraint=None)
+        propIds, propTags = opsdb.fetchPropInfo()
+    else:
+        # same visits, in the same order.
+        simdata = read_opsim_visits(conn, version=opsimVersion)
+        propIds, propTags = read_opsim_prop_tags(conn, version=opsimVersion)
+        conn.close()
+    if show_diagnostic_plots or save_plots:
+        # the rotational dither stacker may wrap rotTelPos in place
+        undithered_rotTelPos = simdata['rotTelPos'].copy()
+    else:
+        undithered_rotTelPos = simdata['rotTelPos']
 
-        # set up to run the stackers that add columns for translational and rotational dithers.
-        metric = metrics.PassMetric()  # want to access the database; no analysis needed
-        slicer = slicers.OneDSlicer(sliceColName='night', binsize=1, verbose=print_progress)   # essentially accessing all nights
-        sqlconstraint = None
-
-        resultsDb = db.ResultsDb(outDir=outDir)
-        ################################################################################################
-        # set up metric bundle to run stackers for large translational dithers + rotational dithers
-        if print_progress: print('Setting up for WFD translational dithers + rot dithers.')
-        bgroup= {}
-        stackerList = [stackers.RandomDitherFieldPerVisitStacker(degrees=opsdb.raDecInDeg,
+    chipSize= 1.75*2/15
+    chipMaxDither= chipSize/2.
+    dithered_RA, dithered_Dec = {}, {}
+    if dither_engine=='maf':
+        import lsst.sims.maf.stackers as stackers
+        ############################################################################################
+        # run the stackers for large translational dithers + rotational dithers
+        if print_progress: print('Running stackers for WFD translational dithers + rot dithers.')
+        stackerList = [stackers.RandomDitherFieldPerVisitStacker(degrees=raDecInDeg,
                                                                 randomSeed=trans_rand_seed),
-                       stackers.RandomRotDitherPerFilterChangeStacker(degrees=opsdb.raDecInDeg,
+                       stackers.RandomRotDitherPerFilterChangeStacker(degrees=raDecInDeg,
                                                                       randomSeed=rot_rand_seed)]
+        for stacker in stackerList:
+            simdata = stacker.run(simdata)
+
+        # copy the WFD dithers, since the DD stacker writes to the same columns
+        dithered_RA['WFD'] = simdata['randomDitherFieldPerVisitRa'].copy()
+        dithered_Dec['WFD'] = simdata['randomDitherFieldPerVisitDec'].copy()
+        dithered_rotTelPos = simdata['randomDitherPerFilterChangeRotTelPos']
+
+        # run the stacker for small translational dithers
+        if print_progress: print('\nRunning stacker for DD translational dithers.')
+        stacker = stackers.RandomDitherFieldPerVisitStacker(maxDither= chipMaxDither,
+                                                            degrees=raDecInDeg,
+                                                            randomSeed=trans_rand_seed)
+        simdata = stacker.run(simdata, override=True)
+        dithered_RA['DD'] = simdata['randomDitherFieldPerVisitRa']
+        dithered_Dec['DD'] = simdata['randomDitherFieldPerVisitDec']
+    else:
+        ############################################################################################
+        # same dithers, calculated on the whole arrays with numpy.
+        if print_progress: print('Calculating WFD, DD translational dithers + rot dithers.')
+        for key, maxDither in [('WFD', 1.75), ('DD', chipMaxDither)]:
+            dithered_RA[key], dithered_Dec[key] = random_dither_field_per_visit(simdata['fieldRA'],
+                                                                                simdata['fieldDec'],
+                                                                                maxDither=maxDither,
+                                                                                degrees=raDecInDeg,
+                                                                                randomSeed=trans_rand_seed)
+        dithered_rotTelPos = random_rot_dither_per_filter_change(simdata['rotTelPos'], simdata['filter'],
+                                                                 degrees=raDecInDeg,
+                                                                 randomSeed=rot_rand_seed)
+
+    ################################################################################################
+    # diagnostic plots
+    if show_diagnostic_plots:
+        # histograms of dithers
+        fig, axes = plt.subplots(nrows=1, ncols=3)
         
-        bundle = metricBundles.MetricBundle(metric, slicer, sqlconstraint=sqlconstraint,
-                                            stackerList=stackerList)
-        bgroup['WFD'] = metricBundles.MetricBundleGroup({0: bundle}, opsdb, outDir=outDir,
-                                                        resultsDb=resultsDb, saveEarly=False,
-                                                        verbose=print_progress)
-        # run the bundle
-        bgroup['WFD'].runAll()
+        for key in dithered_RA:
+            # ra
+            axes[0].hist(dithered_RA[key]-simdata['fieldRA'],
+                         label='%s dithers: delRA'%key, histtype='step', lw=2, bins= 30)
+       
+            # dec
+            axes[1].hist(dithered_Dec[key]-simdata['fieldDec'],
+                         label='%s dithers: delDec'%key, histtype='step', lw=2)
         
-        # set up the bundle for small translational dithers
-        if print_progress: print('\nSetting up for DD translational dithers.')
-        chipSize= 1.75*2/15
-        chipMaxDither= chipSize/2.
-        stackerList = [stackers.RandomDitherFieldPerVisitStacker(maxDither= chipMaxDither,
-                                                                 degrees=opsdb.raDecInDeg,
-                                                                 randomSeed=trans_rand_seed)]
-        bundle = metricBundles.MetricBundle(metric, slicer, sqlconstraint=sqlconstraint,
-                                             stackerList=stackerList)
+        # tel pos
+        axes[2].hist(dithered_rotTelPos-undithered_rotTelPos,
+                     label='rot dithers: rotTelPos', histtype='step', lw=2)
+        for ax in axes:
+            ax.ticklabel_format(style='sci', axis='y', scilimits=(0,0))
+            ax.set_ylabel('Counts')
         
-        bgroup['DD'] = metricBundles.MetricBundleGroup({0: bundle}, opsdb, outDir=outDir,
-                                                       resultsDb=resultsDb, saveEarly=False,
-                                                       verbose=print_progress)
-        # run the bundle
-        bgroup['DD'].runAll()
-
-        ################################################################################################
-        # access the relevant columns
-        dithered_RA, dithered_Dec = {}, {}
-        for key in bgroup:
-            dithered_RA[key] = bgroup[key].simData['randomDitherFieldPerVisitRa']
-            dithered_Dec[key] = bgroup[key].simData['randomDitherFieldPerVisitDec']
+        axes[0].legend()
+        axes[1].legend()
         
-        dithered_rotTelPos = bgroup['WFD'].simData['randomDitherPerFilterChangeRotTelPos']
-
-        ################################################################################################
-        # diagnostic plots
-        if show_diagnostic_plots:
-            # histograms of dithers
-            fig, axes = plt.subplots(nrows=1, ncols=3)
-            
-            for key in bgroup:
-                # ra
-                axes[0].hist(dithered_RA[key]-simdata['fieldRA'],
-                             label='%s dithers: delRA'%key, histtype='step', lw=2, bins= 30)
-           
-                # dec
-                axes[1].hist(dithered_Dec[key]-simdata['fieldDec'],
-                             label='%s dithers: delDec'%key, histtype='step', lw=2)
-            
-            # tel pos
-            axes[2].hist(dithered_rotTelPos-simdata['rotTelPos'],
-                         label='rot dithers: rotTelPos', histtype='step', lw=2)
-            for ax in axes:
-                ax.ticklabel_format(style='sci', axis='y', scilimits=(0,0))
-                ax.set_ylabel('Counts')
-            
-            axes[0].legend()
-            axes[1].legend()
-            
-            if opsdb.raDecInDeg: unitlabel = 'degrees'
-            else: unitlabel = 'radians'
-                
-            axes[0].set_xlabel('delRA (%s)'%unitlabel)
-            axes[1].set_xlabel('delDec (%s)'%unitlabel)
-            axes[2].set_xlabel('delRotTelPos (%s)'%unitlabel)
+        if raDecInDeg: unitlabel = 'degrees'
+        else: unitlabel = 'radians'
             
-            plt.title(dbfile)
-            fig.set_size_inches(20,5)
-            
-        ################################################################################################
-        # initiate the final arrays as undithered fieldRA, fieldDec as nonWFD, nonDDF should remain unchanged
-        descDitheredRA = simdata['fieldRA'].copy()
-        descDitheredDec = simdata['fieldDec'].copy()
-        descDitheredRot = simdata['rotTelPos'].copy()
+        axes[0].set_xlabel('delRA (%s)'%unitlabel)
+        axes[1].set_xlabel('delDec (%s)'%unitlabel)
+        axes[2].set_xlabel('delRotTelPos (%s)'%unitlabel)
         
-        # need to find the indices for WFD vs. DD observations since we are adding different
-        # translational dithers for WFD/DDF visits + none for other surveys
-        propIds, propTags = opsdb.fetchPropInfo()
-        # ok work with WFD visits now
-        ind_WFD = np.where(simdata[propIDcol]==propTags['WFD'])[0]
-        if print_progress:
-            tot= len(simdata)
-            print('Total visits: ', tot)
-            print('propTags: ', propTags)
-            print('%s WFD visits out of total %s'%(len(ind_WFD), tot))
-
-        descDitheredRA[ind_WFD] = dithered_RA['WFD'][ind_WFD]
-        descDitheredDec[ind_WFD] = dithered_Dec['WFD'][ind_WFD]
+        plt.title(dbfile)
+        fig.set_size_inches(20,5)
         
-        # work with DD visits now
-        ind_DD = np.where(simdata[propIDcol]==propTags['DD'])[0]
-        if print_progress:
-            print('%s DD visits out of total %s'%(len(ind_DD), tot))
+    ################################################################################################
+    # initiate the final arrays as undithered fieldRA, fieldDec as nonWFD, nonDDF should remain unchanged
+    descDitheredRA = simdata['fieldRA'].copy()
+    descDitheredDec = simdata['fieldDec'].copy()
+    descDitheredRot = simdata['rotTelPos'].copy()
+    
+    # need to find the indices for WFD vs. DD observations since we are adding different
+    # translational dithers for WFD/DDF visits + none for other surveys
+    # ok work with WFD visits now
+    ind_WFD = np.where(simdata[propIDcol]==propTags['WFD'])[0]
+    if print_progress:
+        tot= len(simdata)
+        print('Total visits: ', tot)
+        print('propTags: ', propTags)
+        print('%s WFD visits out of total %s'%(len(ind_WFD), tot))
+
+    descDitheredRA[ind_WFD] = dithered_RA['WFD'][ind_WFD]
+    descDitheredDec[ind_WFD] = dithered_Dec['WFD'][ind_WFD]
+    
+    # work with DD visits now
+    ind_DD = np.where(simdata[propIDcol]==propTags['DD'])[0]
+    if print_progress:
+        print('%s DD visits out of total %s'%(len(ind_DD), tot))
 
-        descDitheredRA[ind_DD] = dithered_RA['DD'][ind_DD]
-        descDitheredDec[ind_DD] = dithered_Dec['DD'][ind_DD]
+    descDitheredRA[ind_DD] = dithered_RA['DD'][ind_DD]
+    descDitheredDec[ind_DD] = dithered_Dec['DD'][ind_DD]
+    
+    # add rotational dithers to everything
+    descDitheredRot = dithered_rotTelPos
+    
+    ###############################################################
+    # diagnostic plots
+    if show_diagnostic_plots or save_plots:
+        # histograms of desc dithered positions
+        fig, axes = plt.subplots(nrows=1, ncols=3)
         
-        # add rotational dithers to everything
-        descDitheredRot = dithered_rotTelPos
+        _, bins, _ = axes[0].hist(descDitheredRA, label='descDitheredRA', histtype='step', lw=2)
+        axes[0].hist(simdata['fieldRA'], label='fieldRA', histtype='step', lw=2, bins=bins)
         
-        ###############################################################
-        # diagnostic plots
-        if show_diagnostic_plots or save_plots:
-            # histograms of desc dithered positions
-            fig, axes = plt.subplots(nrows=1, ncols=3)
-            
-            _, bins, _ = axes[0].hist(descDitheredRA, label='descDitheredRA', histtype='step', lw=2)
-            axes[0].hist(simdata['fieldRA'], label='fieldRA', histtype='step', lw=2, bins=bins)
-            
-            _, bins, _ = axes[1].hist(descDitheredDec, label='descDitheredDec', histtype='step', lw=2)
-            axes[1].hist(simdata['fieldDec'], label='fieldDec', histtype='step', lw=2, bins=bins)
+        _, bins, _ = axes[1].hist(descDitheredDec, label='descDitheredDec', histtype='step', lw=2)
+        axes[1].hist(simdata['fieldDec'], label='fieldDec', histtype='step', lw=2, bins=bins)
+        
+        _, bins, _ = axes[2].hist(descDitheredRot, label='descDitheredRot', histtype='step', lw=2)
+        axes[2].hist(undithered_rotTelPos, label='rotTelPos', histtype='step', lw=2, bins=bins)
+        
+        if raDecInDeg: xlabel = 'degrees'
+        else: xlabel = 'radians'
             
-            _, bins, _ = axes[2].hist(descDitheredRot, label='descDitheredRot', histtype='step', lw=2)
-            axes[2].hist(simdata['rotTelPos'], label='rotTelPos', histtype='step', lw=2, bins=bins)
+        for ax in axes:
+            ax.legend()
+            ax.set_xlabel(xlabel)
+            ax.set_ylabel('Counts')
             
-            if opsdb.raDecInDeg: xlabel = 'degrees'
-            else: xlabel = 'radians'
-                
-            for ax in axes:
-                ax.legend()
-                ax.set_xlabel(xlabel)
-                ax.set_ylabel('Counts')
-                
-            plt.suptitle(dbfile)
-            fig.set_size_inches(20,5)
-
-            if save_plots:
-                filename='hist_descDithers_%s.png'%(dbfile.split('.db')[0])
-                plt.savefig('%s/%s'%(outDir, filename), format= 'png', bbox_inches='tight')
-                readme += '\nSaved hist for descDithers in %s.'%filename
-
-                if print_progress:
-                    print('\nSaved hist plot in %s'%filename)
-
-            if show_diagnostic_plots:
-                plt.show()
-            else:
-                plt.close('all')
-
-        ###############################################################   
-        # save the columns as a csv file.
-        d= {obsIDcol: simdata[obsIDcol], 
-            'descDitheredRA': descDitheredRA, 'descDitheredDec': descDitheredDec, 
+        plt.suptitle(dbfile)
+        fig.set_size_inches(20,5)
+
+        if save_plots:
+            filename='hist_descDithers_%s.png'%(dbfile.split('.db')[0])
+            plt.savefig('%s/%s'%(outDir, filename), format= 'png', bbox_inches='tight')
+            readme += '\nSaved hist for descDithers in %s.'%filename
+
+            if print_progress:
+                print('\nSaved hist plot in %s'%filename)
+
+        if show_diagnostic_plots:
+            plt.show()
+        else:
+            plt.close('all')
+
+    ###############################################################   
+    # save the columns as a csv file.
+    d= {obsIDcol: simdata[obsIDcol], 
+        'descDitheredRA': descDitheredRA, 'descDitheredDec': descDitheredDec, 
+        'descDitheredRotTelPos': descDitheredRot}
+    
+    filename= 'descDithers_%s.csv'%(dbfile.split('.db')[0])
+    pd.DataFrame(d).to_csv('%s/%s'%(outDir, filename), index=False)
+
+    readme += '\nSaved the dithers in %s'%filename
+    timeTaken = time.time()-startTime
+    readme += '\nTime taken: %.2f (min)\n\n'%(timeTaken/60.)
+
+    if print_progress:
+        print('\nSaved the dithers in %s'%filename)
+        print('Time taken: %.2f (min)\n\n'%(timeTaken/60.))
+
+    return readme, timeTaken
+
+def _save_csv_dithers_chunked(dbs_path, dbfile, outDir, rot_rand_seed, trans_rand_seed,
+                              print_progress, chunk_size):
+    """
+
+    Calculate and save the dithers for one db file, chunk_size visits at a time, with
+    dither_engine='numpy'; see save_csv_dithers for the inputs. The random draws, and the
+    filter for the rotational dithers, carry on from one chunk to the next, so the
+    translational dithers are the same as when all the visits are processed at once; the
+    rotational ones depend on chunk_size (see numpy_dithers.RotDitherStream).
+    Returns the readme text for the file and the time taken (in seconds).
+
+    """
+    startTime = time.time()
+    readme = '%s'%dbfile
+
+    if print_progress: print('Starting: %s\n'%dbfile)
+
+    # let sqlite sort the visits by time in temporary files rather than in memory, and
+    # don't memory map the database, since the mapped pages add to the resident memory.
+    conn = connect_opsim_db('%s/%s'%(dbs_path, dbfile), mmap_size=0, temp_store_memory=False)
+    opsimVersion = opsim_version(conn)
+    raDecInDeg = (opsimVersion=='V4')
+    propIDcol, obsIDcol= 'proposalId', 'observationId'
+    if (opsimVersion=='V3'):
+        propIDcol, obsIDcol= 'propID', 'obsHistID'
+    propIds, propTags = read_opsim_prop_tags(conn, version=opsimVersion)
+    # the translational dithers depend on the total number of visits
+    nvisits = count_opsim_visits(conn, version=opsimVersion)
+
+    chipSize= 1.75*2/15
+    chipMaxDither= chipSize/2.
+    fieldStreams = {'WFD': FieldDitherStream(nvisits, maxDither=1.75, degrees=raDecInDeg,
+                                             randomSeed=trans_rand_seed),
+                    'DD': FieldDitherStream(nvisits, maxDither=chipMaxDither, degrees=raDecInDeg,
+                                            randomSeed=trans_rand_seed)}
+    rotStream = RotDitherStream(degrees=raDecInDeg, randomSeed=rot_rand_seed)
+    if print_progress:
+        print('Total visits: ', nvisits)
+        print('propTags: ', propTags)
+
+    filename= 'descDithers_%s.csv'%(dbfile.split('.db')[0])
+    csvFile = open('%s/%s'%(outDir, filename), 'w')
+    csvFile.write('%s,descDitheredRA,descDitheredDec,descDitheredRotTelPos\n'%obsIDcol)
+    nDithered = {'WFD': 0, 'DD': 0}
+    for visits in iter_opsim_visits(conn, version=opsimVersion, chunk_size=chunk_size):
+        # undithered fieldRA, fieldDec for nonWFD, nonDD visits
+        descDitheredRA = visits['fieldRA'].copy()
+        descDitheredDec = visits['fieldDec'].copy()
+        for key in fieldStreams:
+            ditheredRA, ditheredDec = fieldStreams[key].dither(visits['fieldRA'], visits['fieldDec'])
+            ind = np.where(visits[propIDcol]==propTags[key])[0]
+            descDitheredRA[ind] = ditheredRA[ind]
+            descDitheredDec[ind] = ditheredDec[ind]
+            nDithered[key] += len(ind)
+        descDitheredRot = rotStream.dither(visits['rotTelPos'], visits['filter'])
+
+        d= {obsIDcol: visits[obsIDcol],
+            'descDitheredRA': descDitheredRA, 'descDitheredDec': descDitheredDec,
             'descDitheredRotTelPos': descDitheredRot}
-        
-        filename= 'descDithers_%s.csv'%(dbfile.split('.db')[0])
-        pd.DataFrame(d).to_csv('%s/%s'%(outDir, filename), index=False)
+        pd.DataFrame(d).to_csv(csvFile, index=False, header=False)
+    csvFile.close()
+    conn.close()
 
-        readme += '\nSaved the dithers in %s'%filename
-        readme += '\nTime taken: %.2f (min)\n\n'%((time.time()-startTime)/60.)
+    if print_progress:
+        print('%s WFD visits out of total %s'%(nDithered['WFD'], nvisits))
+        print('%s DD visits out of total %s'%(nDithered['DD'], nvisits))
 
-        if print_progress:
-            print('\nSaved the dithers in %s'%filename)
-            print('Time taken: %.2f (min)\n\n'%((time.time()-startTime)/60.))
+    readme += '\nSaved the dithers in %s'%filename
+    timeTaken = time.time()-startTime
+    readme += '\nTime taken: %.2f (min)\n\n'%(timeTaken/60.)
 
-        readme_file= open('%s/readme.txt'%(outDir), 'a')
-        readme_file.write(readme)
-        readme_file.close()
+    if print_progress:
+        print('\nSaved the dithers in %s'%filename)
+        print('Time taken: %.2f (min)\n\n'%(timeTaken/60.))
 
-    # mark the end in the readme.
-    readme_file= open('%s/readme.txt'%(outDir), 'a')
-    readme_file.write('All done. Total time taken: %.2f (min)\n\n'%((time.time()-startTime_0)/60.))
-    readme_file.close()
\ No newline at end of file
+    return readme, timeTaken
@@ -0,0 +1,434 @@
+#!/bin/env python
+"Benchmark simsee generation, interpolation, and output."
+
+
+import sys
+import os
+from argparse import ArgumentParser
+import configparser
+import datetime
+import fnmatch
+import importlib.metadata
+import json
+import platform
+import resource
+import subprocess
+import tempfile
+import time
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
+import pandas as pd
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+import simsee
+
+# constants
+
+__author__ = "Eric H. Neilsen, Jr."
+__maintainer__ = "Eric H. Neilsen, Jr."
+__email__ = "neilsen@fnal.gov"
+
+# model parameters, as in etc/simsee_pachon7.conf
+model_params = {'outer_scale': 30.0,
+                'mean_log_r0': -0.9170,
+                'seasonal_amplitude': 0.048,
+                'seasonal_phase': 18.8,
+                'nightly_coeff': 0.2,
+                'nightly_innovation': 0.084,
+                'sample_coeff': 0.7,
+                'sample_innovation': 0.052,
+                'random_seed': 6564}
+
+# 2022-06-01, simulated from the DIMM fixture with years_offset
+start_mjd = 59731.0
+years_offset = 18
+
+# the synthetic DIMM fixture covers these dates
+fixture_start_date = '2004-03-01'
+fixture_end_date = '2006-03-01'
+
+# exception classes
+
+# interface functions
+
+
+def benchmark_cases(quick=False):
+    """List the benchmarks to run.
+
+    Args:
+        quick: omit the slowest cases
+
+    Returns:
+        a list of (name, params) tuples, where name is a benchmark
+        function in this module, without the bench_ prefix
+    """
+    durations = [30, 365] if quick else [30, 365, 3652]
+    freqs = [300, 900] if quick else [60, 300, 900]
+    missing_fractions = [0.1, 0.3, 0.6]
+
+    cases = [('startup', {'mode': mode, 'repeats': 5})
+             for mode in ['import', 'simulate', 'dimm']]
+    for days in durations:
+        for freq in freqs:
+            cases.append(('seeing', {'days': days, 'freq': freq}))
+            cases.append(('seeing_arrays', {'days': days, 'freq': freq}))
+
+    ar1_kernels = sorted({'lfilter', simsee.ar1_kernel_name('auto')})
+    for ar1_kernel in ar1_kernels:
+        cases.append(('seeing_arrays', {'days': 365, 'freq': freqs[0],
+                                        'ar1_kernel': ar1_kernel}))
+        cases.append(('ar1_segments', {'days': durations[-1], 'freq': 60,
+                                       'ar1_kernel': ar1_kernel}))
+
+    for missing_fraction in missing_fractions:
+        cases.append(('interpolate_seeing',
+                      {'days': 365, 'freq': 300,
+                       'missing_fraction': missing_fraction}))
+
+    cases.append(('load_dimm', {'window_days': None, 'cached': False}))
+    cases.append(('load_dimm', {'window_days': 365, 'cached': False}))
+    cases.append(('load_dimm', {'window_days': 365, 'cached': True}))
+
+    for output_format in ['text', 'opsim_db'] + sorted(simsee.seeing_writers):
+        cases.append(('writer', {'days': 365, 'freq': 300,
+                                 'format': output_format}))
+
+    return cases
+
+
+def run_benchmarks(cases, workdir):
+    """Run benchmarks, each in a fresh process.
+
+    Args:
+        cases: a list of (name, params) tuples, as from benchmark_cases
+        workdir: a directory for fixtures and output files
+
+    Returns:
+        a list of dictionaries with the results
+    """
+    # A new process for each case, so peak RSS measures only that case.
+    context = multiprocessing.get_context('spawn')
+    results = []
+    for name, params in cases:
+        with ProcessPoolExecutor(1, mp_context=context) as executor:
+            result = executor.submit(run_case, name, params, workdir).result()
+        results.append(result)
+        print(json.dumps(result), file=sys.stderr)
+
+    return results
+
+
+def make_dimm_fixture(fname, missing_fraction=0.3, gap_rate=0.01,
+                      random_seed=1):
+    """Write a synthetic DIMM data set in the format simsee reads.
+
+    Args:
+        fname: the HDF5 file to write
+        missing_fraction: the fraction of nights with no measurements
+        gap_rate: the probability that a gap (of 5 to 80 minutes)
+            follows any measurement
+        random_seed: the random seed for the fixture
+
+    Returns:
+        the number of measurements written
+
+    Measurements are taken every 60 to 90 seconds, starting shortly
+    after 0h UT, on nights from fixture_start_date to fixture_end_date.
+    """
+    rng = np.random.default_rng(random_seed)
+    nights = pd.date_range(fixture_start_date, fixture_end_date, freq='D')
+    nights = nights[rng.random(len(nights)) >= missing_fraction]
+
+    times = []
+    for night in nights:
+        num_measurements = int(rng.integers(50, 500))
+        dt = np.cumsum(rng.integers(60, 90, num_measurements))
+        gaps = rng.random(num_measurements) < gap_rate
+        dt += np.cumsum(gaps*rng.integers(300, 5000, num_measurements))
+        times.append(night + pd.Timedelta(minutes=30)
+                     + pd.to_timedelta(dt, unit='s'))
+
+    index = pd.DatetimeIndex(np.concatenate(times), name='time')
+    seeing = np.round(np.exp(rng.normal(-0.1, 0.3, len(index))), 2)
+    dimm = pd.DataFrame({'seeing': seeing}, index=index)
+    dimm.to_hdf(fname, key='dimm', format='table')
+    return len(dimm)
+
+
+def run_case(name, params, workdir):
+    """Run one benchmark.
+
+    Args:
+        name: the name of the benchmark
+        params: a dictionary of parameters for the benchmark
+        workdir: a directory for fixtures and output files
+
+    Returns:
+        a dictionary with the results
+    """
+    benchmark = globals()['bench_' + name](workdir, **params)
+    setup_rss = peak_rss()
+
+    start_time = time.perf_counter()
+    num_samples = benchmark()
+    seconds = time.perf_counter() - start_time
+
+    return {'name': name,
+            'params': params,
+            'samples': num_samples,
+            'seconds': seconds,
+            'samples_per_second': num_samples/seconds,
+            'setup_peak_rss_bytes': setup_rss,
+            'peak_rss_bytes': peak_rss(),
+            'child_peak_rss_bytes': peak_rss(resource.RUSAGE_CHILDREN)}
+
+
+def bench_startup(workdir, mode, repeats):
+    """Start new python processes that import or run simsee.
+
+    Modes are import (just import simsee), simulate (run simsee.py
+    for one day, without DIMM data), and dimm (run simsee.py for one
+    day, with the DIMM fixture). Each start counts as one sample, and
+    the peak RSS of the started processes is the child_peak_rss_bytes.
+    """
+    if mode == 'import':
+        command = [sys.executable, '-c', 'import simsee']
+    else:
+        config_fname = os.path.join(workdir, 'startup_{0}.conf'.format(mode))
+        write_config(config_fname, 1, 300,
+                     dimm_fixture(workdir) if mode == 'dimm' else None)
+        command = [sys.executable, simsee.__file__, config_fname]
+
+    def benchmark():
+        for repeat in range(repeats):
+            subprocess.run(command, check=True, stdout=subprocess.DEVNULL,
+                           cwd=os.path.dirname(simsee.__file__))
+        return repeats
+
+    return benchmark
+
+
+def bench_seeing(workdir, days, freq):
+    """Iterate over the samples from simsee.seeing."""
+    kwargs = sim_kwargs(days, freq)
+
+    def benchmark():
+        return sum(1 for sample in simsee.seeing(**kwargs))
+
+    return benchmark
+
+
+def bench_seeing_arrays(workdir, days, freq, ar1_kernel='lfilter'):
+    """Generate a block of samples with simsee.seeing_arrays."""
+    kwargs = dict(sim_kwargs(days, freq), ar1_kernel=ar1_kernel)
+    # Compile (or load) the numba kernel outside the timed run
+    simsee.seeing_arrays(**dict(kwargs, end_mjd=kwargs['start_mjd'] + 1))
+
+    def benchmark():
+        return len(simsee.seeing_arrays(**kwargs))
+
+    return benchmark
+
+
+def bench_ar1_segments(workdir, days, freq, ar1_kernel):
+    """Calculate AR1 series restarting every night with simsee.ar1_segments."""
+    samples_per_night = 12*60*60//freq
+    rng = np.random.default_rng(1)
+    innovations = rng.standard_normal(days*samples_per_night)
+    segment_start = np.arange(0, len(innovations), samples_per_night)
+    initial_values = rng.standard_normal(len(segment_start))
+    simsee.ar1_segments(0.7, innovations[:samples_per_night], [0], [0.0],
+                        ar1_kernel)
+
+    def benchmark():
+        simsee.ar1_segments(0.7, innovations, segment_start, initial_values,
+                            ar1_kernel)
+        return len(innovations)
+
+    return benchmark
+
+
+def bench_interpolate_seeing(workdir, days, freq, missing_fraction):
+    """Fill gaps in DIMM data and write text with simsee.interpolate_seeing."""
+    dimm = simsee.load_dimm(dimm_fixture(workdir, missing_fraction),
+                            outer_scale=model_params['outer_scale'])
+    kwargs = sim_kwargs(days, freq)
+
+    def benchmark():
+        with CountingFile() as fp:
+            simsee.interpolate_seeing(dimm, fp, years_offset=years_offset,
+                                      **kwargs)
+        return fp.lines - 1
+
+    return benchmark
+
+
+def bench_load_dimm(workdir, window_days, cached):
+    """Load the DIMM fixture, perhaps in a window, perhaps from a cache."""
+    fname = dimm_fixture(workdir)
+    kwargs = {'outer_scale': model_params['outer_scale']}
+    if window_days is not None:
+        mjd_offset = int(round(simsee.year_length_days*years_offset))
+        kwargs['start_mjd'] = start_mjd - mjd_offset
+        kwargs['end_mjd'] = start_mjd + window_days - mjd_offset
+    if cached:
+        kwargs['cache_dir'] = tempfile.mkdtemp(dir=workdir)
+        simsee.load_dimm(fname, **kwargs)
+
+    def benchmark():
+        return len(simsee.load_dimm(fname, **kwargs))
+
+    return benchmark
+
+
+def bench_writer(workdir, days, freq, format):
+    """Write pregenerated blocks of samples in an output format."""
+    blocks = list(simsee.seeing_chunks(**sim_kwargs(days, freq)))
+    num_samples = sum(len(block) for block in blocks)
+    fname = os.path.join(tempfile.mkdtemp(dir=workdir), 'seeing')
+
+    def benchmark():
+        if format == 'text':
+            with open(fname, 'w') as fp:
+                for block in blocks:
+                    fp.write(simsee.format_seeing(block))
+        elif format == 'opsim_db':
+            simsee.write_opsim_seeing_db(fname, blocks)
+        else:
+            writer = simsee.seeing_writers[format](fname)
+            for block in blocks:
+                writer.write(block)
+            writer.close()
+        return num_samples
+
+    return benchmark
+
+
+def main():
+    """Parse command line arguments and run the benchmarks."""
+    parser = ArgumentParser(description="Benchmark simsee.")
+    parser.add_argument("--output", type=str, default=None,
+        help="file to which to write the JSON results "
+             "(standard output by default)")
+    parser.add_argument("--quick", action="store_true",
+        help="skip the slowest cases")
+    parser.add_argument("--only", type=str, default=None,
+        help="run only benchmarks with names matching this glob pattern")
+    parser.add_argument("--workdir", type=str, default=None,
+        help="directory for fixtures and output files "
+             "(a temporary directory by default)")
+    args = parser.parse_args()
+
+    cases = benchmark_cases(args.quick)
+    if args.only is not None:
+        cases = [case for case in cases if fnmatch.fnmatch(case[0], args.only)]
+
+    if args.workdir is None:
+        with tempfile.TemporaryDirectory() as workdir:
+            results = run_benchmarks(cases, workdir)
+    else:
+        os.makedirs(args.workdir, exist_ok=True)
+        results = run_benchmarks(cases, args.workdir)
+
+    report = {'environment': environment(), 'results': results}
+    if args.output is None:
+        json.dump(report, sys.stdout, indent=2)
+        print()
+    else:
+        with open(args.output, 'w') as fp:
+            json.dump(report, fp, indent=2)
+
+    return 0
+
+
+# classes
+
+
+class CountingFile:
+    """A file-like object that counts and discards lines written to it."""
+
+    def __init__(self):
+        self.lines = 0
+
+    def write(self, text):
+        self.lines += text.count('\n')
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        return False
+
+
+# internal functions & classes
+
+
+def sim_kwargs(days, freq):
+    """Keyword arguments for simulating days of seeing every freq seconds."""
+    return dict(model_params, start_mjd=start_mjd, end_mjd=start_mjd + days,
+                freq=freq)
+
+
+def write_config(fname, days, freq, dimm_fname=None):
+    """Write a simsee configuration file for the benchmark model."""
+    config = configparser.ConfigParser()
+    start_date = simsee.mjd_epoch + datetime.timedelta(days=start_mjd)
+    end_date = start_date + datetime.timedelta(days=days)
+    config['simulation'] = {'start_date': start_date.isoformat() + 'Z',
+                            'end_date': end_date.isoformat() + 'Z',
+                            'freq': freq,
+                            'random_seed': model_params['random_seed']}
+    config['optics'] = {'outer_scale': model_params['outer_scale']}
+    config['seasonal'] = {'mean': model_params['mean_log_r0'],
+                          'c': model_params['seasonal_amplitude'],
+                          'd': model_params['seasonal_phase']}
+    config['nightly'] = {'coeff': model_params['nightly_coeff'],
+                         'innovation': model_params['nightly_innovation']}
+    config['sample'] = {'coeff': model_params['sample_coeff'],
+                        'innovation': model_params['sample_innovation']}
+    if dimm_fname is not None:
+        config['dimm'] = {'fname': dimm_fname, 'years_offset': years_offset}
+
+    with open(fname, 'w') as fp:
+        config.write(fp)
+
+
+def dimm_fixture(workdir, missing_fraction=0.3):
+    """Get the name of a DIMM fixture, making it if it does not exist."""
+    fname = os.path.join(workdir,
+                         'dimm_{0:.2f}.h5'.format(missing_fraction))
+    if not os.path.exists(fname):
+        make_dimm_fixture(fname, missing_fraction)
+    return fname
+
+
+def peak_rss(who=resource.RUSAGE_SELF):
+    """The peak resident set size of this process (or children), in bytes."""
+    max_rss = resource.getrusage(who).ru_maxrss
+    # Linux reports kilobytes, macOS bytes
+    return max_rss if sys.platform == 'darwin' else max_rss*1024
+
+
+def environment():
+    """Describe the versions of the code and libraries benchmarked."""
+    try:
+        commit = subprocess.run(
+            ['git', 'rev-parse', 'HEAD'], capture_output=True, text=True,
+            cwd=os.path.dirname(os.path.abspath(__file__))).stdout.strip()
+    except OSError:
+        commit = ''
+
+    return {'commit': commit,
+            'python': platform.python_version(),
+            'numpy': np.__version__,
+            'pandas': pd.__version__,
+            'numba': (importlib.metadata.version('numba')
+                      if simsee.ar1_kernel_name('auto') == 'numba' else None),
+            'platform': platform.platform(),
+            'time': time.strftime('%Y-%m-%dT%H:%M:%S%z')}
+
+
+if __name__ == '__main__':
+    status = main()
+    sys.exit(status)
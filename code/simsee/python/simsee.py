@@ -5,11 +5,28 @@
 import sys
 from argparse import ArgumentParser
 import configparser
-from collections import namedtuple
+from collections import namedtuple, deque, defaultdict
+import datetime
 import csv
+import hashlib
+import importlib.util
+import io
+import itertools
+import json
+import os
+import shutil
+import tempfile
+import struct
+import time
+from contextlib import closing, contextmanager, nullcontext
+from functools import lru_cache
+from concurrent.futures import ProcessPoolExecutor
 import numpy as np
-import pandas as pd
-import astropy.time
+
+# pandas is imported only where DIMM data or HDF5 files are handled,
+# astropy only to parse dates that iso_to_mjd cannot, and scipy,
+# sqlite3, cProfile, and the socket and compression modules only in the
+# functions and modes that use them, so that simsee starts quickly.
 
 # constants
 
@@ -19,11 +36,330 @@ __email__ = "neilsen@fnal.gov"
 
 year_length_days = 365.24217
 
+# MJD 0
+mjd_epoch = datetime.datetime(1858, 11, 17)
+
+# columns of blocks of seeing samples; dimm_time is NaT for artificial samples
+seeing_dtype = np.dtype([('mjd', np.float64),
+                         ('elapsed_seconds', np.int64),
+                         ('r0', np.float64),
+                         ('seeing', np.float64),
+                         ('kol_seeing', np.float64),
+                         ('dimm_time', 'datetime64[s]')])
+
+# columns of simsee.SeeingColumns, with their types; dimm_time is in
+# nanoseconds since 1970, and the smallest int64 (NaT) for artificial samples
+compact_seeing_dtypes = {'mjd': np.float64,
+                         'elapsed_seconds': np.int64,
+                         'r0': np.float32,
+                         'seeing': np.float32,
+                         'kol_seeing': np.float32,
+                         'measured': np.bool_,
+                         'dimm_time': np.int64}
+
+# columns (other than time) in the cache of DIMM data, with their types;
+# increment dimm_cache_version when the contents of the cache change.
+# The seeing columns are kept as float64, as simsee.load_dimm calculates
+# them: float32 would halve the cache, but the seeing interpolated from
+# the rounded values would then differ from that of an uncached load.
+dimm_cache_dtypes = {'seeing': np.float64,
+                     'r0': np.float64,
+                     'log_r0': np.float64,
+                     'vk_seeing': np.float64,
+                     'mjd': np.float64,
+                     'night_mjd': np.int32}
+dimm_cache_version = 1
+
+# arguments of simsee.seeing_arrays that a parameter sweep may vary
+model_parameters = ('outer_scale', 'mean_log_r0',
+                    'seasonal_amplitude', 'seasonal_phase',
+                    'nightly_coeff', 'nightly_innovation',
+                    'sample_coeff', 'sample_innovation')
+
+# parameters (with their defaults) that must not change when a data set
+# is extended from a checkpoint
+checkpoint_defaults = {'start_mjd': None,
+                       'freq': None,
+                       'random_seed': None,
+                       'start_elapsed_seconds': 0,
+                       'init_nightly_offset': 0.0,
+                       'init_sample_offset': None,
+                       'outer_scale': None,
+                       'mean_log_r0': None,
+                       'seasonal_amplitude': None,
+                       'seasonal_phase': None,
+                       'nightly_coeff': None,
+                       'nightly_innovation': None,
+                       'sample_coeff': None,
+                       'sample_innovation': None,
+                       'max_sun_altitude': None}
+checkpoint_version = 1
+
+# the StageTimer recording where a run spends its time, or None if the
+# run is not being profiled (see simsee.profile_stage)
+stage_timer = None
+
+# kernels that calculate segmented AR1 series (see simsee.ar1_kernel_name)
+ar1_kernels = ('lfilter', 'numba', 'auto')
+
+# keys distinguishing the random streams used for each night
+nightly_stream_key = 0
+sample_stream_key = 1
+
 # exception classes
 
 # interface functions
 
 
+def seeing_arrays(start_mjd, end_mjd, freq,
+                  outer_scale,
+                  mean_log_r0,
+                  seasonal_amplitude, seasonal_phase,
+                  nightly_coeff, nightly_innovation,
+                  sample_coeff, sample_innovation,
+                  init_nightly_offset=0.0,
+                  init_sample_offset=None,
+                  start_elapsed_seconds=0,
+                  nightly_offsets=None,
+                  random_seed=None,
+                  nights=None,
+                  ar1_kernel='lfilter',
+                  max_sun_altitude=None):
+    """Generate a block of seeing values as columns.
+
+    Args:
+        start_mjd: the MJD of the first generated seeing value
+        end_mjd: the MJD of the last generated seeing value
+        freq: seconds between generated seeing values
+        mean_log_r0: the global mean log10(r0)
+        seasonal_amplitude: amplitude of seasonal variation in log10(r0)
+        seasonal_phase: phase of seasonal variation in log10(r0)
+            (peak r0 in days after November 17)
+        nightly_coeff: AR1 model coefficient for nightly variation
+        nightly_innovation: amplitude of nightly model variation in log10(r0)
+        sample_coeff: AR1 model coefficient for sample variation
+        sample_innovation: amplitude of sample model variation in log10(r0)
+        init_nightly_offset: the nightly offset preceding the first night
+        init_sample_offset: the sample offset preceding the first sample,
+            or None to draw it from the stationary distribution
+        start_elapsed_seconds: elapsed seconds at start_mjd
+        nightly_offsets: nightly offsets for each night, starting with
+            the night of start_mjd, or None to simulate them
+        random_seed: the seed from which random streams are derived
+        nights: a tuple with the first and last night MJD to generate,
+            or None to generate all nights from start_mjd to end_mjd
+        ar1_kernel: the kernel that calculates the sample AR1 series
+            (see simsee.ar1_kernel_name)
+        max_sun_altitude: generate only samples taken while the sun is
+            below this altitude (in degrees), or None to generate
+            samples at all times
+
+    Returns:
+        a numpy structured array with dtype seeing_dtype
+
+    The whole time grid is built at once, and the AR1 series are
+    calculated with a recursive filter over arrays of innovations.
+
+    Random values for each night are drawn from their own streams
+    (see simsee.night_rng), so that any range of nights can be
+    regenerated (using the nights argument) without generating the
+    nights that precede it. The sample AR1 series restarts at the
+    start of each night (at local noon) from a value drawn from its
+    stationary distribution. If max_sun_altitude is set, daytime
+    samples are never generated, and the sample AR1 series also
+    restarts at the start of each stretch of night-time samples.
+
+    >>> samples = seeing_arrays(61100.0, 61103.0, 300,
+    ...                         20,
+    ...                         -0.9424, 0.058, 296.5, 0.3, 0.09, 0.7, 0.053,
+    ...                         random_seed=6563)
+    ...
+    >>> len(samples)
+    865
+    >>> samples['seeing'][:3]
+    array([0.62551752, 0.82274482, 0.75239816])
+    >>> one_night = seeing_arrays(61100.0, 61103.0, 300,
+    ...                           20,
+    ...                           -0.9424, 0.058, 296.5, 0.3, 0.09, 0.7, 0.053,
+    ...                           random_seed=6563, nights=(61101, 61101))
+    ...
+    >>> first = np.searchsorted(samples['mjd'], one_night['mjd'][0])
+    >>> np.array_equal(one_night['seeing'],
+    ...                samples['seeing'][first:first+len(one_night)])
+    True
+    """
+    return seeing_ensemble([random_seed], start_mjd, end_mjd, freq,
+                           outer_scale,
+                           mean_log_r0,
+                           seasonal_amplitude, seasonal_phase,
+                           nightly_coeff, nightly_innovation,
+                           sample_coeff, sample_innovation,
+                           init_nightly_offset=init_nightly_offset,
+                           init_sample_offset=init_sample_offset,
+                           start_elapsed_seconds=start_elapsed_seconds,
+                           nightly_offsets=nightly_offsets,
+                           nights=nights,
+                           ar1_kernel=ar1_kernel,
+                           max_sun_altitude=max_sun_altitude)[0]
+
+
+def seeing_ensemble(random_seeds, start_mjd, end_mjd, freq,
+                    outer_scale,
+                    mean_log_r0,
+                    seasonal_amplitude, seasonal_phase,
+                    nightly_coeff, nightly_innovation,
+                    sample_coeff, sample_innovation,
+                    init_nightly_offset=0.0,
+                    init_sample_offset=None,
+                    start_elapsed_seconds=0,
+                    nightly_offsets=None,
+                    nights=None,
+                    ar1_kernel='lfilter',
+                    max_sun_altitude=None):
+    """Generate several realizations of seeing values at once.
+
+    Args:
+        random_seeds: a sequence with the random seed of each realization
+
+    The remaining arguments are as in simsee.seeing_arrays, except that
+    nightly_offsets may have one row for each realization.
+
+    Returns:
+        a 2-dimensional numpy structured array with dtype seeing_dtype,
+        with one row for each realization
+
+    Each row is identical to what simsee.seeing_arrays generates with
+    the corresponding random seed, but the time grid, night
+    assignments, and seasonal variation are calculated only once, and
+    the AR1 series of all realizations are filtered together.
+
+    >>> kwargs = dict(freq=300, outer_scale=20, mean_log_r0=-0.9424,
+    ...               seasonal_amplitude=0.058, seasonal_phase=296.5,
+    ...               nightly_coeff=0.3, nightly_innovation=0.09,
+    ...               sample_coeff=0.7, sample_innovation=0.053)
+    >>> ensemble = seeing_ensemble([6563, 6564, 6565], 61100.0, 61103.0,
+    ...                            **kwargs)
+    >>> ensemble.shape
+    (3, 865)
+    >>> samples = seeing_arrays(61100.0, 61103.0, random_seed=6564, **kwargs)
+    >>> np.array_equal(ensemble[1]['seeing'], samples['seeing'])
+    True
+    """
+    random_seeds = [np.random.SeedSequence().entropy if seed is None else seed
+                    for seed in random_seeds]
+
+    if nightly_offsets is not None:
+        nightly_offsets = as_offset_rows(nightly_offsets)
+        layout = night_layout(start_mjd, end_mjd, freq, nights,
+                              nightly_offsets.shape[-1], max_sun_altitude)
+    else:
+        layout = night_layout(start_mjd, end_mjd, freq, nights,
+                              max_sun_altitude=max_sun_altitude)
+        night_mjds = np.arange(layout.first_night,
+                               layout.night_mjd[-1] + 1 if len(layout.mjd) else
+                               layout.first_night)
+        nightly_offsets = np.array([
+            simulate_nightly_offsets(night_mjds,
+                                     nightly_coeff, nightly_innovation,
+                                     init_nightly_offset, random_seed)
+            for random_seed in random_seeds]).reshape(len(random_seeds), -1)
+
+    draws = np.array([sample_normals(random_seed, layout,
+                                     start_elapsed_seconds)
+                      for random_seed in random_seeds])
+    draws = draws.reshape(len(random_seeds), -1)
+
+    return model_seeing(layout, draws, nightly_offsets,
+                        outer_scale, mean_log_r0,
+                        seasonal_amplitude, seasonal_phase,
+                        sample_coeff, sample_innovation,
+                        init_sample_offset, start_elapsed_seconds,
+                        ar1_kernel=ar1_kernel)
+
+
+def seeing_sweep(variants, start_mjd, end_mjd, freq,
+                 init_nightly_offset=0.0,
+                 init_sample_offset=None,
+                 start_elapsed_seconds=0,
+                 nightly_offsets=None,
+                 random_seed=None,
+                 nights=None,
+                 ar1_kernel='lfilter',
+                 max_sun_altitude=None):
+    """Generate seeing values for several sets of model parameters at once.
+
+    Args:
+        variants: a sequence of dictionaries, one for each set of
+            model parameters, each with the outer_scale, mean_log_r0,
+            seasonal_amplitude, seasonal_phase, nightly_coeff,
+            nightly_innovation, sample_coeff, and sample_innovation
+            arguments of simsee.seeing_arrays
+
+    The remaining arguments are as in simsee.seeing_arrays, except that
+    nightly_offsets, if given, must have one row for each variant.
+
+    Returns:
+        a 2-dimensional numpy structured array with dtype seeing_dtype,
+        with one row for each variant
+
+    Each row is identical to what simsee.seeing_arrays generates with
+    the parameters of the corresponding variant, but the time grid and
+    night assignments are calculated, and the random values drawn,
+    only once; each variant scales the same standard normal draws by
+    its own innovations.
+
+    >>> kwargs = dict(outer_scale=20, mean_log_r0=-0.9424,
+    ...               seasonal_amplitude=0.058, seasonal_phase=296.5,
+    ...               nightly_coeff=0.3, nightly_innovation=0.09,
+    ...               sample_coeff=0.7, sample_innovation=0.053)
+    >>> variants = [kwargs, dict(kwargs, sample_innovation=0.03)]
+    >>> sweep = seeing_sweep(variants, 61100.0, 61103.0, 300,
+    ...                      random_seed=6563)
+    >>> sweep.shape
+    (2, 865)
+    >>> samples = seeing_arrays(61100.0, 61103.0, 300, random_seed=6563,
+    ...                         **variants[1])
+    >>> np.array_equal(sweep[1]['seeing'], samples['seeing'])
+    True
+    """
+    if random_seed is None:
+        random_seed = np.random.SeedSequence().entropy
+
+    if nightly_offsets is not None:
+        nightly_offsets = as_offset_rows(nightly_offsets)
+        layout = night_layout(start_mjd, end_mjd, freq, nights,
+                              nightly_offsets.shape[-1], max_sun_altitude)
+    else:
+        layout = night_layout(start_mjd, end_mjd, freq, nights,
+                              max_sun_altitude=max_sun_altitude)
+        night_mjds = np.arange(layout.first_night,
+                               layout.night_mjd[-1] + 1 if len(layout.mjd) else
+                               layout.first_night)
+        nightly_draws = nightly_normals(night_mjds, random_seed)
+        nightly_offsets = np.array([
+            ar1_array(variant['nightly_coeff'],
+                      variant['nightly_innovation']*nightly_draws,
+                      init_nightly_offset)
+            for variant in variants]).reshape(len(variants), -1)
+
+    draws = sample_normals(random_seed, layout,
+                           start_elapsed_seconds)[np.newaxis, :]
+
+    samples = np.empty((len(variants), len(layout.mjd)), dtype=seeing_dtype)
+    for row, variant in enumerate(variants):
+        samples[row] = model_seeing(layout, draws, nightly_offsets[row:row+1],
+                                    variant['outer_scale'],
+                                    variant['mean_log_r0'],
+                                    variant['seasonal_amplitude'],
+                                    variant['seasonal_phase'],
+                                    variant['sample_coeff'],
+                                    variant['sample_innovation'],
+                                    init_sample_offset, start_elapsed_seconds,
+                                    ar1_kernel=ar1_kernel)[0]
+
+    return samples
+
+
 def seeing(start_mjd, end_mjd, freq,
            outer_scale,
            mean_log_r0,
@@ -31,10 +367,12 @@ def seeing(start_mjd, end_mjd, freq,
            nightly_coeff, nightly_innovation,
            sample_coeff, sample_innovation,
            init_nightly_offset=0.0,
-           init_sample_offset=0.0,
+           init_sample_offset=None,
            start_elapsed_seconds=0,
            nightly_offsets=None,
-           random_seed=None):
+           random_seed=None,
+           ar1_kernel='lfilter',
+           max_sun_altitude=None):
     """A generator to generate seeing values.
 
     Args:
@@ -61,6 +399,8 @@ def seeing(start_mjd, end_mjd, freq,
         r0: Fried parameter, in meters
         seeing: FWHM in arcseconds
 
+    The values are calculated by simsee.seeing_arrays.
+
     Example:
 
     >>> seeing_generator = seeing(61100.0, 61101.0, 300,
@@ -71,72 +411,295 @@ def seeing(start_mjd, end_mjd, freq,
     >>> for s in list(seeing_generator)[:5]:
     ...     print(s)
     ... # doctest: +ELLIPSIS
-    SeeingSample(mjd=61100.0, elapsed_seconds=0, r0=0.08097..., seeing=1.03902...)
-    SeeingSample(mjd=61100.00347..., elapsed_seconds=300, r0=0.07717..., seeing=1.09429...)
-    SeeingSample(mjd=61100.00694..., elapsed_seconds=600, r0=0.07659..., seeing=1.10319...)
-    SeeingSample(mjd=61100.01041..., elapsed_seconds=900, r0=0.06214..., seeing=1.38053...)
-    SeeingSample(mjd=61100.01388..., elapsed_seconds=1200, r0=0.06491..., seeing=1.31761...)
+    SeeingSample(mjd=61100.0, elapsed_seconds=0, r0=0.12901..., seeing=0.62551...)
+    SeeingSample(mjd=61100.00347..., elapsed_seconds=300, r0=0.10043..., seeing=0.82274...)
+    SeeingSample(mjd=61100.00694..., elapsed_seconds=600, r0=0.10901..., seeing=0.75239...)
+    SeeingSample(mjd=61100.01041..., elapsed_seconds=900, r0=0.12346..., seeing=0.65648...)
+    SeeingSample(mjd=61100.01388..., elapsed_seconds=1200, r0=0.11653..., seeing=0.69948...)
 
     """
-    if random_seed is not None:
-        np.random.seed(random_seed)
+    samples = seeing_arrays(start_mjd, end_mjd, freq,
+                            outer_scale,
+                            mean_log_r0,
+                            seasonal_amplitude, seasonal_phase,
+                            nightly_coeff, nightly_innovation,
+                            sample_coeff, sample_innovation,
+                            init_nightly_offset=init_nightly_offset,
+                            init_sample_offset=init_sample_offset,
+                            start_elapsed_seconds=start_elapsed_seconds,
+                            nightly_offsets=nightly_offsets,
+                            random_seed=random_seed,
+                            ar1_kernel=ar1_kernel,
+                            max_sun_altitude=max_sun_altitude)
+
+    yield from seeing_records(samples)
+
+
+def seeing_chunks(start_mjd, end_mjd, chunk_nights=30, workers=1,
+                  formatter=None, random_seeds=None, variants=None,
+                  from_night=None, **kwargs):
+    """Generate seeing values in chunks of nights, in parallel if requested.
 
-    if nightly_offsets is None:
-        nightly_offsets = ar1(nightly_coeff,
-                              nightly_innovation,
-                              init_nightly_offset)
+    Args:
+        start_mjd: the MJD of the first generated seeing value
+        end_mjd: the MJD of the last generated seeing value
+        chunk_nights: the number of nights in each chunk
+        workers: the number of processes generating chunks
+        formatter: a function applied to each chunk by the process
+            that generates it, or None to return the chunk itself
+        random_seeds: random seeds of an ensemble of realizations,
+            or None to generate a single realization
+        variants: sets of model parameters to generate together (see
+            simsee.seeing_sweep), or None to use the model parameters
+            in the remaining arguments
+        from_night: the first night to generate, or None to start
+            with the night of start_mjd
+
+    The remaining arguments are as in simsee.seeing_arrays.
 
-    sample_offsets = ar1(sample_coeff, sample_innovation, init_sample_offset)
+    Returns:
+        a generator that yields the chunks (or their formatted
+        versions) in time order
+
+    The chunks are as returned by simsee.seeing_arrays or, if
+    random_seeds is set, by simsee.seeing_ensemble or, if variants is
+    set, by simsee.seeing_sweep.
+
+    The nightly AR1 series is simulated once, before the chunks are
+    generated, and all other random values are drawn from streams for
+    each night, so the chunks are identical for any number of workers.
+    Only one chunk (or, with several workers, a few per worker) is held
+    in memory at a time, however long the span.
+
+    >>> kwargs = dict(freq=300, outer_scale=20, mean_log_r0=-0.9424,
+    ...               seasonal_amplitude=0.058, seasonal_phase=296.5,
+    ...               nightly_coeff=0.3, nightly_innovation=0.09,
+    ...               sample_coeff=0.7, sample_innovation=0.053,
+    ...               random_seed=6563)
+    >>> chunks = list(seeing_chunks(61100.0, 61110.0, 4, **kwargs))
+    >>> [len(chunk) for chunk in chunks]
+    [952, 1152, 777]
+    >>> samples = seeing_arrays(61100.0, 61110.0, **kwargs)
+    >>> np.array_equal(np.concatenate(chunks)['seeing'], samples['seeing'])
+    True
+    """
+    if random_seeds is None:
+        if kwargs.get('random_seed') is None:
+            kwargs['random_seed'] = np.random.SeedSequence().entropy
+        seeds = [kwargs['random_seed']]
+    else:
+        kwargs.pop('random_seed', None)
+        seeds = [np.random.SeedSequence().entropy if seed is None else seed
+                 for seed in random_seeds]
+        kwargs['random_seeds'] = seeds
+
+    first_night = calc_night_mjd(start_mjd)
+    last_night = calc_night_mjd(end_mjd)
+    if variants is not None:
+        for name in model_parameters:
+            kwargs.pop(name, None)
+        kwargs['variants'] = variants
+
+    if variants is not None and kwargs.get('nightly_offsets') is None:
+        init_nightly_offset = kwargs.pop('init_nightly_offset', 0.0)
+        nightly_draws = nightly_normals(np.arange(first_night, last_night + 1),
+                                        kwargs['random_seed'])
+        kwargs['nightly_offsets'] = np.array([
+            ar1_array(variant['nightly_coeff'],
+                      variant['nightly_innovation']*nightly_draws,
+                      init_nightly_offset)
+            for variant in variants])
+    elif kwargs.get('nightly_offsets') is None:
+        init_nightly_offset = kwargs.pop('init_nightly_offset', 0.0)
+        nightly_offsets = np.array([
+            simulate_nightly_offsets(np.arange(first_night, last_night + 1),
+                                     kwargs['nightly_coeff'],
+                                     kwargs['nightly_innovation'],
+                                     init_nightly_offset, seed)
+            for seed in seeds])
+        kwargs['nightly_offsets'] = nightly_offsets if random_seeds is not None \
+            else nightly_offsets[0]
+
+    kwargs.update(start_mjd=start_mjd, end_mjd=end_mjd)
+    chunk_kwargs = (dict(kwargs, nights=(night, min(night + chunk_nights - 1,
+                                                    last_night)))
+                    for night in range(first_night if from_night is None
+                                       else from_night,
+                                       last_night + 1, chunk_nights))
+
+    if workers > 1:
+        # Keep only a few chunks per worker in flight, so that memory
+        # use does not grow when the consumer is slower than the workers.
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            pending = deque()
+            for these_kwargs in chunk_kwargs:
+                pending.append(executor.submit(seeing_chunk, formatter,
+                                               these_kwargs))
+                if len(pending) >= 2*workers:
+                    with profile_stage('workers'):
+                        chunk = pending.popleft().result()
+                    yield chunk
+            while pending:
+                with profile_stage('workers'):
+                    chunk = pending.popleft().result()
+                yield chunk
+    else:
+        for these_kwargs in chunk_kwargs:
+            yield seeing_chunk(formatter, these_kwargs)
 
-    def seasonal_offset(mjd):
-        return year_cos(mjd, seasonal_phase, seasonal_amplitude)
 
-    mjd = start_mjd
-    elapsed_seconds = start_elapsed_seconds
+def sim_seeing(fp=sys.stdout, first=False, workers=1, checkpoint_fname=None,
+               **kwargs):
+    """Generate artificial seeing and write it to a file.
 
-    # iterate over nights
-    for nightly_offset in nightly_offsets:
-        if mjd > end_mjd:
-            break
+    Args:
+        fp: the file pointer to the file to write
+        first: write a header line before the data
+        workers: the number of processes to use to generate the data
+        checkpoint_fname: a file in which to save what
+            simsee.resume_seeing needs to extend the data set,
+            or None to not save it
 
-        night_log_r0 = (mean_log_r0
-                        + seasonal_offset(mjd + 0.5)
-                        + nightly_offset)
-        night_mjd = calc_night_mjd(mjd)
-        # iterate over samples within the night
-        for sample_offset in sample_offsets:
-            if mjd > end_mjd:
-                break
+    The remaining arguments are as in simsee.seeing_chunks.
 
-            if calc_night_mjd(mjd) > night_mjd:
-                break
+    The data is generated and formatted a chunk of nights at a time,
+    so memory use does not depend on the length of the span.
+    """
+    if checkpoint_fname is not None:
+        if kwargs.get('random_seed') is None:
+            kwargs['random_seed'] = np.random.SeedSequence().entropy
+        if kwargs.get('nightly_offsets') is None:
+            first_night = calc_night_mjd(kwargs['start_mjd'])
+            kwargs['nightly_offsets'] = simulate_nightly_offsets(
+                np.arange(first_night, calc_night_mjd(kwargs['end_mjd']) + 1),
+                kwargs['nightly_coeff'], kwargs['nightly_innovation'],
+                kwargs.get('init_nightly_offset', 0.0), kwargs['random_seed'])
+
+    if first:
+        csv.writer(fp, delimiter="\t").writerow(SeeingSample._fields)
+    for text in seeing_chunks(workers=workers, formatter=format_seeing,
+                              **kwargs):
+        with profile_stage('write', nbytes=len(text)):
+            fp.write(text)
+
+    if checkpoint_fname is not None:
+        write_seeing_checkpoint(checkpoint_fname, **kwargs)
+
+
+def resume_seeing(fp, checkpoint_fname, workers=1, **kwargs):
+    """Extend a data set written by simsee.sim_seeing to a later end.
 
-            log_r0 = night_log_r0 + sample_offset
-            r0 = np.power(10, log_r0)
-            seeing = vk_seeing(r0, outer_scale)
-            kol_seeing = 60*60*np.degrees(0.98*5e-7/r0)
-            yield SeeingSample(mjd, elapsed_seconds, r0, seeing,
-                               round(kol_seeing, 2), 'artificial')
+    Args:
+        fp: the file pointer to which to append the new data
+        checkpoint_fname: the checkpoint saved with the data set, which
+            is replaced by one for the extended data set
+        workers: the number of processes to use to generate the data
+
+    The remaining arguments are as in simsee.sim_seeing, and all but
+    end_mjd (and those that affect only performance) must match those
+    with which the data set was generated.
+
+    Only samples after the last one in the existing data set are
+    written, and they are identical to those a single run to the new
+    end_mjd would have written. Random values for each night are drawn
+    from their own streams (see simsee.night_rng), so the only state
+    needed is the position of the last sample and the nightly offset of
+    its night; the rest of that night is regenerated and skipped.
+    """
+    checkpoint = read_seeing_checkpoint(checkpoint_fname)
+    for key, default in checkpoint_defaults.items():
+        if kwargs.get(key, default) != checkpoint['params'].get(key, default):
+            raise ValueError("{0} does not match that in checkpoint {1}".format(
+                key, checkpoint_fname))
+    if kwargs['end_mjd'] < checkpoint['end_mjd']:
+        raise ValueError("end_mjd is before that in checkpoint {0}".format(
+            checkpoint_fname))
+
+    first_night = calc_night_mjd(kwargs['start_mjd'])
+    resume_night = checkpoint['night_mjd']
+    last_night = max(resume_night, calc_night_mjd(kwargs['end_mjd']))
+
+    # Offsets of nights before the resumed one are not needed
+    nightly_offsets = np.full(last_night - first_night + 1, np.nan)
+    nightly_offsets[resume_night - first_night] = checkpoint['nightly_offset']
+    nightly_offsets[resume_night - first_night + 1:] = simulate_nightly_offsets(
+        np.arange(resume_night + 1, last_night + 1),
+        kwargs['nightly_coeff'], kwargs['nightly_innovation'],
+        checkpoint['nightly_offset'], kwargs['random_seed'])
+    kwargs['nightly_offsets'] = nightly_offsets
+
+    chunk_kwargs = {key: value for key, value in kwargs.items()
+                    if key != 'chunk_nights'}
+    samples = seeing_arrays(nights=(resume_night, resume_night),
+                            **chunk_kwargs)
+    fp.write(format_seeing(
+        samples[samples['elapsed_seconds'] > checkpoint['elapsed_seconds']]))
+
+    for text in seeing_chunks(workers=workers, formatter=format_seeing,
+                              from_night=resume_night + 1, **kwargs):
+        with profile_stage('write', nbytes=len(text)):
+            fp.write(text)
+
+    write_seeing_checkpoint(checkpoint_fname, **kwargs)
+
+
+def sim_ensemble(fps, random_seeds, workers=1, **kwargs):
+    """Generate an ensemble of artificial seeing data sets.
 
-            elapsed_seconds += freq
-            dt = elapsed_seconds - start_elapsed_seconds
-            mjd = start_mjd + dt/(24.0*60.0*60.0)
+    Args:
+        fps: either a list of file pointers, one for each realization,
+            or a single file pointer to which all realizations are
+            written, with an additional realization column
+        random_seeds: the random seed for each realization
+        workers: the number of processes to use to generate the data
 
+    The remaining arguments are as in simsee.seeing
+    """
+    stacked = not isinstance(fps, (list, tuple))
+    if stacked:
+        csv.writer(fps, delimiter="\t").writerow(
+            ('realization',) + SeeingSample._fields)
+        formatter = format_stacked_ensemble
+    else:
+        for fp in fps:
+            csv.writer(fp, delimiter="\t").writerow(SeeingSample._fields)
+        formatter = format_ensemble
 
-def sim_seeing(fp=sys.stdout, first=False, **kwargs):
-    """Generate artificial seeing and write it to a file.
+    for text in seeing_chunks(workers=workers, formatter=formatter,
+                              random_seeds=random_seeds, **kwargs):
+        with profile_stage('write', nbytes=len(text) if stacked
+                           else sum(map(len, text))):
+            if stacked:
+                fps.write(text)
+            else:
+                for fp, realization_text in zip(fps, text):
+                    fp.write(realization_text)
 
-    Args:
-        fp: the file pointer to the file to write
 
-    The remaining arguments are as in simsee.seeing
+def sim_sweep(outputs, variants, workers=1, **kwargs):
+    """Generate artificial seeing for each of a set of model parameters.
+
+    Args:
+        outputs: a list with, for each variant, either a file pointer
+            to which to write text, or a writer (e.g. SeeingHDF5Writer)
+        variants: the model parameters of each variant, as in
+            simsee.seeing_sweep
+        workers: the number of processes to use to generate the data
+
+    The remaining arguments are as in simsee.seeing, but the model
+    parameters in them are replaced by those of each variant.
     """
-    writer = csv.writer(sys.stdout, delimiter="\t")
-    for seeing_record in seeing(**kwargs):
-        if first:
-            writer.writerow(seeing_record._fields)
-            first = False
-        writer.writerow(seeing_record)
+    text = not isinstance(outputs[0], tuple(seeing_writers.values()))
+    if text:
+        for fp in outputs:
+            csv.writer(fp, delimiter="\t").writerow(SeeingSample._fields)
+
+    for chunk in seeing_chunks(workers=workers,
+                               formatter=format_ensemble if text else None,
+                               variants=variants, **kwargs):
+        with profile_stage('write'):
+            for output, block in zip(outputs, chunk):
+                output.write(block)
 
 
 def interpolate_seeing(dimm, fp=sys.stdout, **kwargs):
@@ -151,10 +714,40 @@ def interpolate_seeing(dimm, fp=sys.stdout, **kwargs):
 
     The remaining arguments are the same as in sim_seeing.
     """
-    if 'random_seed' in kwargs:
-        random_seed = kwargs['random_seed']
-        if random_seed is not None:
-            np.random.seed(random_seed)
+    writer = csv.writer(fp, delimiter="\t")
+    writer.writerow(SeeingSample._fields)
+    with profile_stage('gap_fill') as stage:
+        samples = interpolate_seeing_arrays(dimm, **kwargs)
+        stage.samples += len(samples)
+    with profile_stage('format', len(samples)):
+        text = format_seeing(samples)
+    with profile_stage('write', nbytes=len(text)):
+        fp.write(text)
+
+
+def interpolate_seeing_arrays(dimm, **kwargs):
+    """Get seeing values from DIMM data, simulating values in gaps.
+
+    Args:
+       dimm: a pandas.DataFrame with the dimm data
+
+    The remaining arguments are the same as in interpolate_seeing.
+
+    Returns:
+       a numpy structured array with dtype seeing_dtype, with
+       measured and simulated values in time order
+
+    Wherever consecutive DIMM measurements (or the start time and the
+    first measurement) are separated by more than freq seconds, the gap
+    is filled with values simulated every freq seconds (only while the
+    sun is below max_sun_altitude, if it is given). The simulation
+    follows the nightly seeing from simsee.interpolate_night_seeing,
+    and its sample AR1 series starts from the offset of the
+    measurement preceding the gap. All gaps are filled at once.
+    """
+    random_seed = kwargs.get('random_seed')
+    if random_seed is None:
+        random_seed = np.random.SeedSequence().entropy
 
     start_mjd = kwargs['start_mjd']
     end_mjd = kwargs['end_mjd']
@@ -165,107 +758,551 @@ def interpolate_seeing(dimm, fp=sys.stdout, **kwargs):
     seasonal_phase = kwargs['seasonal_phase']
     nightly_coeff = kwargs['nightly_coeff']
     nightly_innovation = kwargs['nightly_innovation']
+    sample_coeff = kwargs['sample_coeff']
+    sample_innovation = kwargs['sample_innovation']
     freq = kwargs['freq']
-    freq_days = freq/(24.0*60*60)
-
-    # Many but not all of the keyword arguments are propagated
-    # directly into sim_seeing
-    sim_seeing_kwargs = {k: kwargs[k] for k in
-                         ['freq', 'outer_scale', 'mean_log_r0',
-                          'seasonal_amplitude', 'seasonal_phase',
-                          'nightly_coeff', 'nightly_innovation',
-                          'sample_coeff', 'sample_innovation']}
+    ar1_kernel = kwargs.get('ar1_kernel', 'lfilter')
+    seconds_per_day = 24.0*60.0*60.0
+    freq_days = freq/seconds_per_day
 
     # Get then mean seeing in each night in the requeste range
     # Do thes before we filter on time to include measuremens
     # at edge nights that are not within the strict limits,
     # if the limits are part way into their nights.
-    nightly_dimm = interpolate_night_seeing(dimm,
-                                            calc_night_mjd(start_mjd),
-                                            calc_night_mjd(end_mjd) + 1,
-                                            years_offset, mean_log_r0,
-                                            seasonal_amplitude, seasonal_phase,
-                                            nightly_coeff, nightly_innovation)
+    first_night = calc_night_mjd(start_mjd)
+    with profile_stage('nightly_interpolation') as stage:
+        nightly_dimm = interpolate_night_seeing(
+            dimm, first_night, calc_night_mjd(end_mjd) + 1,
+            years_offset, mean_log_r0,
+            seasonal_amplitude, seasonal_phase,
+            nightly_coeff, nightly_innovation,
+            random_seed, ar1_kernel).values
+        stage.samples += len(nightly_dimm)
 
     # actually filter to get measurements in the requested time range
-    dimm_in_time = dimm.query('{0} < mjd < {1}'.format(start_mjd-mjd_offset,
-                                                       end_mjd-mjd_offset))
-    dimm_in_time = dimm_in_time.copy()
-    dimm_in_time['elapsed_seconds'] = np.round(
-        (dimm_in_time.mjd+mjd_offset-start_mjd)*24*60*60).astype(int)
-
-    def seasonal_offset(mjd):
-        return year_cos(mjd, seasonal_phase, seasonal_amplitude)
-
-    prev_mjd = start_mjd
-
-    writer = csv.writer(sys.stdout, delimiter="\t")
-    writer.writerow(SeeingSample._fields)
-    for dimm_time, dimm_row in dimm_in_time.iterrows():
-        next_mjd = dimm_row.mjd + mjd_offset
-        if next_mjd > prev_mjd + freq_days:
-            try:
-                sim_start_mjd = prev_mjd + freq_days
-                start_elapsed_seconds = int(prev_elapsed_seconds + freq)
-            except UnboundLocalError:
-                # This is the first point
-                sim_start_mjd = start_mjd
-                start_elapsed_seconds = 0
-
-            sim_start_night = calc_night_mjd(sim_start_mjd)
-            sim_end_mjd = min((end_mjd, dimm_row.mjd + mjd_offset - freq_days))
-            sim_end_night = calc_night_mjd(sim_end_mjd)
-
-            try:
-                init_sample_offset = prev_log_r0 - nightly_dimm[sim_start_night]
-            except UnboundLocalError:
-                # This is the first point
-                init_sample_offset = 0
-
-            nightly_offsets = [n - seasonal_offset(start_mjd+0.5) - mean_log_r0
-                               for n in nightly_dimm.loc[sim_start_night:sim_end_night]]
-            sim_seeing(fp,
-                       start_mjd=sim_start_mjd,
-                       end_mjd=sim_end_mjd,
-                       init_sample_offset=init_sample_offset,
-                       start_elapsed_seconds=start_elapsed_seconds,
-                       nightly_offsets=nightly_offsets,
-                       **sim_seeing_kwargs)
-
-        sample_seeing = SeeingSample(next_mjd, int(dimm_row.elapsed_seconds),
-                                     dimm_row.r0, dimm_row.vk_seeing,
-                                     dimm_row.seeing, dimm_time.isoformat())
-
-        prev_log_r0 = dimm_row.log_r0
-        prev_mjd = next_mjd
-        prev_elapsed_seconds = dimm_row.elapsed_seconds
-
-        if next_mjd > end_mjd:
-            break
+    dimm_mjd = dimm.mjd.values
+    dimm_in_time = dimm[(dimm_mjd > start_mjd - mjd_offset)
+                        & (dimm_mjd < end_mjd - mjd_offset)]
+    measured_mjd = dimm_in_time.mjd.values + mjd_offset
+    measured_elapsed = np.round(
+        (dimm_in_time.mjd.values+mjd_offset-start_mjd)*24*60*60).astype(int)
+    measured_log_r0 = dimm_in_time.log_r0.values
+
+    # Measurements after end_mjd are not included, but the gap
+    # before the first of them is still filled.
+    num_measured = np.searchsorted(measured_mjd > end_mjd, True)
+    num_checked = min(num_measured + 1, len(measured_mjd))
+
+    # Find the gaps
+    prev_mjd = np.append(start_mjd, measured_mjd[:num_checked-1])
+    gap_end = np.flatnonzero(measured_mjd[:num_checked] > prev_mjd + freq_days)
+    after_measurement = gap_end > 0
+    prev_index = gap_end[after_measurement] - 1
+
+    sim_start_mjd = np.full(len(gap_end), float(start_mjd))
+    sim_start_mjd[after_measurement] = measured_mjd[prev_index] + freq_days
+    sim_end_mjd = np.minimum(end_mjd, measured_mjd[gap_end] - freq_days)
+    start_elapsed_seconds = np.zeros(len(gap_end), dtype=np.int64)
+    start_elapsed_seconds[after_measurement] = measured_elapsed[prev_index] + freq
+    init_sample_offset = np.zeros(len(gap_end))
+    init_sample_offset[after_measurement] = measured_log_r0[prev_index] \
+        - nightly_dimm[calc_night_mjd(sim_start_mjd[after_measurement])
+                       - first_night]
+
+    # Build the time grid in all gaps
+    num_candidates = np.floor(
+        (sim_end_mjd - sim_start_mjd)*seconds_per_day/freq).astype(int) + 2
+    num_candidates = np.maximum(num_candidates, 0)
+    gap = np.repeat(np.arange(len(gap_end)), num_candidates)
+    dt = freq*(np.arange(len(gap))
+               - np.repeat(np.cumsum(num_candidates) - num_candidates,
+                           num_candidates))
+    mjd = sim_start_mjd[gap] + dt/seconds_per_day
+    in_gap = mjd <= sim_end_mjd[gap]
+    if kwargs.get('max_sun_altitude') is not None:
+        in_gap &= sun_below(mjd, kwargs['max_sun_altitude'])
+    gap, dt, mjd = gap[in_gap], dt[in_gap], mjd[in_gap]
+    elapsed_seconds = start_elapsed_seconds[gap] + dt
+
+    # Split gaps into blocks, one for each night in each gap, each
+    # with its own random stream, as in simsee.seeing_arrays
+    night_mjd = calc_night_mjd(mjd)
+    new_block = np.ones(len(mjd), dtype=bool)
+    new_block[1:] = (gap[1:] != gap[:-1]) | (night_mjd[1:] > night_mjd[:-1]) \
+        | (dt[1:] > dt[:-1] + freq)
+    block_start = np.flatnonzero(new_block)
+    block_index = np.cumsum(new_block) - 1
+    num_blocks = len(block_start)
+    samples_per_block = np.diff(np.append(block_start, len(mjd)))
+
+    draws = np.empty(len(mjd) + num_blocks)
+    block_first_draw = block_start + np.arange(num_blocks)
+    for night, elapsed, first_draw, num_samples in zip(
+            night_mjd[block_start],
+            elapsed_seconds[block_start],
+            block_first_draw,
+            samples_per_block):
+        rng = night_rng(random_seed, night, sample_stream_key, elapsed)
+        rng.standard_normal(out=draws[first_draw:first_draw+num_samples+1])
+
+    init_sample_offsets = draws[block_first_draw] \
+        * sample_innovation/np.sqrt(1 - sample_coeff**2)
+    gap_first_block = np.ones(num_blocks, dtype=bool)
+    gap_first_block[1:] = gap[block_start[1:]] != gap[block_start[:-1]]
+    init_sample_offsets[gap_first_block] = \
+        init_sample_offset[gap[block_start[gap_first_block]]]
+
+    sample_offsets = ar1_segments(
+        sample_coeff,
+        sample_innovation*draws[np.arange(len(mjd)) + block_index + 1],
+        block_start, init_sample_offsets, ar1_kernel)
+
+    # The nightly seeing is expressed relative to the seasonal
+    # offset at the start, and the seasonal offset at the start of
+    # each block added back.
+    nightly_offsets = nightly_dimm[night_mjd[block_start] - first_night] \
+        - year_cos(start_mjd + 0.5, seasonal_phase, seasonal_amplitude) \
+        - mean_log_r0
+    night_log_r0 = (mean_log_r0
+                    + year_cos(mjd[block_start] + 0.5,
+                               seasonal_phase, seasonal_amplitude)
+                    + nightly_offsets)
+    log_r0 = night_log_r0[block_index] + sample_offsets
+
+    simulated = np.empty(len(mjd), dtype=seeing_dtype)
+    simulated['mjd'] = mjd
+    simulated['elapsed_seconds'] = elapsed_seconds
+    simulated['r0'] = np.power(10, log_r0)
+    simulated['seeing'] = vk_seeing(simulated['r0'], kwargs['outer_scale'])
+    simulated['kol_seeing'] = np.round(kol_seeing(simulated['r0']), 2)
+    simulated['dimm_time'] = np.datetime64('NaT')
+
+    measured = np.empty(num_measured, dtype=seeing_dtype)
+    measured['mjd'] = measured_mjd[:num_measured]
+    measured['elapsed_seconds'] = measured_elapsed[:num_measured]
+    measured['r0'] = dimm_in_time.r0.values[:num_measured]
+    measured['seeing'] = dimm_in_time.vk_seeing.values[:num_measured]
+    measured['kol_seeing'] = dimm_in_time.seeing.values[:num_measured]
+    measured['dimm_time'] = dimm_in_time.index.values[:num_measured]
+
+    # Each gap comes just before the measurement that ends it
+    order = np.argsort(np.concatenate([2*gap_end[gap], 2*np.arange(num_measured) + 1]),
+                       kind='stable')
+    return np.concatenate([simulated, measured])[order]
+
+
+def write_opsim_seeing_db(fname, blocks):
+    """Write seeing values to an sqlite3 database that can be read by opsim4.
 
-        writer.writerow(sample_seeing)
+    Args:
+        fname: the name of the database file
+        blocks: an iterable of numpy structured arrays with dtype seeing_dtype
+
+    The values are written to the Seeing table, with columns seeingId
+    (counting from 1), s_date (elapsed seconds), and seeing (von Karman
+    FWHM in arcseconds), replacing any such table already present.
+    Each block is inserted with a single executemany call, all within
+    one transaction, and the index on s_date is built after the load.
+
+    >>> import sqlite3
+    >>> import tempfile
+    >>> samples = seeing_arrays(61100.0, 61101.0, 300,
+    ...                         20,
+    ...                         -0.9424, 0.058, 296.5, 0.3, 0.09, 0.7, 0.053,
+    ...                         random_seed=6563)
+    ...
+    >>> with tempfile.TemporaryDirectory() as temp_dir:
+    ...     db_fname = os.path.join(temp_dir, 'seeing.db')
+    ...     write_opsim_seeing_db(db_fname, [samples[:100], samples[100:]])
+    ...     with closing(sqlite3.connect(db_fname)) as conn:
+    ...         print(conn.execute('SELECT * FROM Seeing WHERE seeingId=2').fetchall())
+    ...
+    [(2, 300, 0.8227448171281914)]
+    """
+    import sqlite3
+    with closing(sqlite3.connect(fname, isolation_level=None)) as conn:
+        # Nothing is gained by protecting a partly written table,
+        # so skip journaling and syncing during the bulk load.
+        conn.execute('PRAGMA journal_mode = OFF')
+        conn.execute('PRAGMA synchronous = OFF')
+        conn.execute('BEGIN')
+        conn.execute('DROP TABLE IF EXISTS Seeing')
+        conn.execute('CREATE TABLE Seeing('
+                     'seeingId INTEGER PRIMARY KEY,'
+                     's_date INTEGER,'
+                     'seeing DOUBLE)')
+        seeing_id = 1
+        for block in blocks:
+            with profile_stage('write', len(block)):
+                conn.executemany('INSERT INTO Seeing VALUES (?, ?, ?)',
+                                 zip(range(seeing_id, seeing_id + len(block)),
+                                     block['elapsed_seconds'].tolist(),
+                                     block['seeing'].tolist()))
+            seeing_id += len(block)
+        conn.execute('CREATE INDEX s_date_idx ON Seeing(s_date)')
+        conn.execute('COMMIT')
+
+
+def write_seeing(writers, random_seeds, dimm=None, workers=1, **kwargs):
+    """Generate seeing data sets and write them with seeing writers.
 
+    Args:
+        writers: either a list of writers (e.g. SeeingHDF5Writer), one
+            for each realization, or a single writer to which all
+            realizations are written, with an additional realization
+            column
+        random_seeds: the random seed for each realization
+        dimm: a pandas.DataFrame with the dimm data, or None to
+            generate the whole data set from the model
+        workers: the number of processes to use to generate the data
+            (ignored with DIMM data, which is interpolated in this process)
+
+    The remaining arguments are as in simsee.seeing or, with DIMM
+    data, as in simsee.interpolate_seeing.
+
+    Writers receive one block of samples for each chunk of nights or,
+    with DIMM data, one block for each realization.
+    """
+    stacked = not isinstance(writers, (list, tuple))
+    if dimm is None:
+        for chunk in seeing_chunks(workers=workers, random_seeds=random_seeds,
+                                   **kwargs):
+            with profile_stage('write', chunk.size):
+                if stacked:
+                    writers.write(stack_ensemble(chunk))
+                else:
+                    for writer, samples in zip(writers, chunk):
+                        writer.write(samples)
+        return
+
+    for realization, random_seed in enumerate(random_seeds):
+        with profile_stage('gap_fill') as stage:
+            samples = interpolate_seeing_arrays(
+                dimm, **dict(kwargs, random_seed=random_seed))
+            stage.samples += len(samples)
+        with profile_stage('write', len(samples)):
+            if stacked:
+                writers.write(stack_ensemble(samples[np.newaxis, :],
+                                             realization))
+            else:
+                writers[realization].write(samples)
+
+
+def main(argv=None):
+    """Parse command line arguments and generate a text file.
 
-def main():
-    """Parse command line arguments and generate a text file."""
+    Args:
+        argv: the command line arguments, by default sys.argv[1:]
+
+    >>> import tempfile
+    >>> config_text = '''
+    ... [simulation]
+    ... start_date = 2022-01-01T00:00:00Z
+    ... end_date = 2022-01-03T00:00:00Z
+    ... freq = 300
+    ... random_seed = 6564
+    ... [optics]
+    ... outer_scale = 30
+    ... [seasonal]
+    ... mean = -0.9170
+    ... c = 0.048
+    ... d = 18.8
+    ... [nightly]
+    ... coeff = 0.2
+    ... innovation = 0.084
+    ... [sample]
+    ... coeff = 0.7
+    ... innovation = 0.052
+    ... '''
+    >>> sweep_text = '''
+    ... [grid]
+    ... nightly.coeff = 0.1, 0.2
+    ... sample.coeff = 0.6, 0.7
+    ... '''
+    >>> with tempfile.TemporaryDirectory() as temp_dir:
+    ...     def fname(name):
+    ...         return os.path.join(temp_dir, name)
+    ...     with open(fname('simsee.conf'), 'w') as fp:
+    ...         _ = fp.write(config_text)
+    ...     with open(fname('sweep.conf'), 'w') as fp:
+    ...         _ = fp.write(sweep_text)
+    ...     main(['--sweep', fname('sweep.conf'),
+    ...           '--output-template', fname('seeing_{name}.txt'),
+    ...           '--output', fname('index.txt'), fname('simsee.conf')])
+    ...     outputs = sorted(name for name in os.listdir(temp_dir)
+    ...                      if name.startswith('seeing_'))
+    ...     contents = set()
+    ...     for output in outputs:
+    ...         with open(fname(output)) as fp:
+    ...             contents.add(fp.read())
+    ...
+    0
+    >>> for output in outputs:
+    ...     print(output)
+    ...
+    seeing_grid_nightly.coeff=0.1_sample.coeff=0.6.txt
+    seeing_grid_nightly.coeff=0.1_sample.coeff=0.7.txt
+    seeing_grid_nightly.coeff=0.2_sample.coeff=0.6.txt
+    seeing_grid_nightly.coeff=0.2_sample.coeff=0.7.txt
+    >>> len(contents)
+    4
+    """
     parser = ArgumentParser(description=
         "Generate a simulated seeing data set for survey strategy simulation.")
     parser.add_argument("config_fname", type=str,
         help="file with configuration parameters")
-    args = parser.parse_args()
-
+    parser.add_argument("--workers", type=int, default=1,
+        help="number of processes generating artificial seeing; "
+             "data with DIMM measurements is generated in one process, "
+             "so only 1 is allowed with a [dimm] section")
+    parser.add_argument("--realizations", type=int, default=1,
+        help="number of realizations to generate, with random seeds "
+             "incremented from that in the configuration")
+    parser.add_argument("--output-template", type=str, default=None,
+        help="file name template for each realization, formatted with "
+             "the realization and random_seed fields, "
+             "e.g. seeing_{realization:03d}.txt; if absent, "
+             "realizations are stacked on standard output")
+    parser.add_argument("--opsim-db", type=str, default=None,
+        help="write the Seeing table of an sqlite3 database for opsim4 "
+             "to this file instead of writing text")
+    parser.add_argument("--format", type=str, default="text",
+        choices=["text"] + sorted(seeing_writers),
+        help="output format; npy writes a directory of column files")
+    parser.add_argument("--output", type=str, default=None,
+        help="output file (or directory, for npy); "
+             "text is written to standard output by default, "
+             "compressed if the name ends in .gz, .bz2, or .xz, "
+             "or sent to a socket if it is tcp://host:port")
+    parser.add_argument("--buffer-size", type=int, default=2**20,
+        help="size of the output buffer of text output, in bytes")
+    parser.add_argument("--chunk-nights", type=int, default=30,
+        help="number of nights generated and written at a time")
+    parser.add_argument("--ar1-kernel", type=str, default="lfilter",
+        choices=ar1_kernels,
+        help="kernel that calculates the sample AR1 series: lfilter, "
+             "numba (compiled with numba), or auto (numba if it is "
+             "installed); all give identical output")
+    parser.add_argument("--checkpoint", type=str, default=None,
+        help="file in which to save the state needed to extend the "
+             "output with --resume (by default, the --output file "
+             "name followed by .checkpoint)")
+    parser.add_argument("--resume", action="store_true",
+        help="append data up to the configured end_date to output "
+             "generated earlier, using its checkpoint")
+    parser.add_argument("--sweep", type=str, default=None,
+        help="file with model parameters to vary; one output is written "
+             "for each variant, named by --output-template (formatted "
+             "with the variant and name fields), and an index of the "
+             "variants is written to --output or standard output")
+    parser.add_argument("--profile", action="store_true",
+        help="write the wall time, samples, and throughput of each stage "
+             "of the run to standard error, as JSON")
+    parser.add_argument("--profile-dump", type=str, default=None,
+        help="also profile the run with cProfile, and save the "
+             "statistics to this file (readable with pstats)")
+    args = parser.parse_args(argv)
+
+    if not args.profile and args.profile_dump is None:
+        return run_main(parser, args)
+
+    global stage_timer
+    stage_timer = StageTimer()
+    if args.profile_dump is not None:
+        import cProfile
+        profiler = cProfile.Profile()
+    else:
+        profiler = None
+    try:
+        if profiler is not None:
+            profiler.enable()
+        return run_main(parser, args)
+    finally:
+        if profiler is not None:
+            profiler.disable()
+            profiler.dump_stats(args.profile_dump)
+        json.dump(stage_timer.summary(), sys.stderr, indent=1)
+        sys.stderr.write('\n')
+        stage_timer = None
+
+
+def run_main(parser, args):
+    """Generate the output requested by parsed command line arguments."""
     config_fname = args.config_fname
-    config = parse_simsee_config(config_fname)
+    with profile_stage('config'):
+        config = parse_simsee_config(config_fname)
 
-    output_fp = sys.stdout
+    try:
+        ar1_kernel = ar1_kernel_name(args.ar1_kernel)
+    except ImportError as error:
+        parser.error(str(error))
+
+    def open_text(fname=None):
+        return open_output(fname, args.buffer_size)
+
+    # DIMM data is interpolated in a single process
+    if args.workers > 1 and 'dimm_fname' in config:
+        parser.error("--workers supports only artificial seeing, "
+                     "without DIMM data")
+
+    # checkpoints are written only for a single text realization
+    # without DIMM data
+    if args.resume or args.checkpoint is not None:
+        option = '--resume' if args.resume else '--checkpoint'
+        if args.sweep is not None or args.opsim_db is not None \
+                or args.format != 'text':
+            parser.error(option + " supports only text output, without "
+                         "--sweep or --opsim-db")
+        if args.realizations > 1 or 'dimm_fname' in config:
+            parser.error(option + " supports only one realization, "
+                         "without DIMM data")
+
+    if args.sweep is not None:
+        if args.output_template is None:
+            parser.error("--output-template is required with --sweep")
+        if args.realizations > 1 or args.opsim_db is not None:
+            parser.error("--sweep cannot be combined with --realizations "
+                         "or --opsim-db")
+        if 'dimm_fname' in config:
+            parser.error("--sweep does not support DIMM data")
+
+        sweep = parse_sweep_config(args.sweep)
+        variants = []
+        for name, overrides in sweep:
+            variant_config = parse_simsee_config(config_fname, overrides)
+            for key in set(variant_config) | set(config):
+                if key not in model_parameters \
+                        and variant_config.get(key) != config.get(key):
+                    parser.error("--sweep can vary only model parameters, "
+                                 "not " + key)
+            variants.append({key: variant_config[key]
+                             for key in model_parameters
+                             if key in variant_config})
+
+        fnames = [args.output_template.format(variant=variant, name=name)
+                  for variant, (name, overrides) in enumerate(sweep)]
+        if len(set(fnames)) != len(fnames):
+            parser.error("--output-template must give each variant of "
+                         "the sweep a different file name")
+        if args.format == 'text':
+            outputs = [open_text(fname) for fname in fnames]
+        else:
+            outputs = [seeing_writers[args.format](fname) for fname in fnames]
+
+        sim_sweep(outputs, variants, workers=args.workers,
+                  chunk_nights=args.chunk_nights, ar1_kernel=ar1_kernel,
+                  **config)
+        for output in outputs:
+            output.close()
+
+        with open_text(args.output) as output_fp:
+            write_sweep_index(output_fp, sweep, fnames)
+
+        return 0
+
+    if args.opsim_db is not None:
+        if args.realizations > 1:
+            parser.error("--opsim-db supports only one realization")
+
+        if 'dimm_fname' in config:
+            dimm = load_config_dimm(config)
+            blocks = [interpolate_seeing_arrays(dimm, ar1_kernel=ar1_kernel,
+                                                **config)]
+        else:
+            blocks = seeing_chunks(workers=args.workers,
+                                   chunk_nights=args.chunk_nights,
+                                   ar1_kernel=ar1_kernel, **config)
+
+        write_opsim_seeing_db(args.opsim_db, blocks)
+        return 0
+
+    if args.format != 'text':
+        if args.output is None and args.output_template is None:
+            parser.error("--output or --output-template is required "
+                         "for --format " + args.format)
+
+        writer_class = seeing_writers[args.format]
+        random_seeds = [config['random_seed'] + realization
+                        for realization in range(args.realizations)]
+        if args.output_template is not None \
+                and (args.realizations > 1 or args.output is None):
+            writers = [writer_class(args.output_template.format(
+                realization=realization, random_seed=random_seed))
+                       for realization, random_seed in enumerate(random_seeds)]
+        elif args.realizations > 1:
+            writers = writer_class(args.output)
+        else:
+            writers = [writer_class(args.output)]
+
+        dimm = load_config_dimm(config) if 'dimm_fname' in config else None
+        write_seeing(writers, random_seeds, dimm, workers=args.workers,
+                     chunk_nights=args.chunk_nights, ar1_kernel=ar1_kernel,
+                     **config)
+
+        for writer in writers if isinstance(writers, list) else [writers]:
+            writer.close()
+
+        return 0
+
+    checkpoint_fname = args.checkpoint
+    if checkpoint_fname is None and args.output is not None \
+            and args.realizations == 1 and 'dimm_fname' not in config:
+        checkpoint_fname = args.output + '.checkpoint'
+
+    if args.resume:
+        if checkpoint_fname is None:
+            parser.error("--resume requires --output or --checkpoint")
+
+        with open_output(args.output, args.buffer_size,
+                         append=True) as output_fp:
+            try:
+                resume_seeing(output_fp, checkpoint_fname,
+                              workers=args.workers,
+                              chunk_nights=args.chunk_nights,
+                              ar1_kernel=ar1_kernel, **config)
+            except ValueError as error:
+                parser.error(str(error))
+
+        return 0
+
+    output_fp = open_text(args.output)
+
+    if args.realizations > 1:
+        random_seeds = [config['random_seed'] + realization
+                        for realization in range(args.realizations)]
+        if args.output_template is None:
+            if 'dimm_fname' in config:
+                parser.error("--output-template is required for ensembles "
+                             "with DIMM data")
+            output_fps = output_fp
+        else:
+            output_fps = [open_text(args.output_template.format(
+                realization=realization, random_seed=random_seed))
+                          for realization, random_seed
+                          in enumerate(random_seeds)]
+    else:
+        random_seeds = [config['random_seed']]
+        output_fps = [output_fp]
 
     if 'dimm_fname' in config:
-        dimm = load_dimm(config['dimm_fname'],
-                         outer_scale=config['outer_scale'])
-        interpolate_seeing(dimm, output_fp, **config)
+        dimm = load_config_dimm(config)
+        for fp, random_seed in zip(output_fps, random_seeds):
+            interpolate_seeing(dimm, fp,
+                               **dict(config, random_seed=random_seed,
+                                      ar1_kernel=ar1_kernel))
+    elif args.realizations > 1:
+        sim_ensemble(output_fps, random_seeds, workers=args.workers,
+                     chunk_nights=args.chunk_nights, ar1_kernel=ar1_kernel,
+                     **config)
     else:
-        sim_seeing(output_fp, True, **config)
-
+        sim_seeing(output_fp, True, workers=args.workers,
+                   checkpoint_fname=checkpoint_fname,
+                   chunk_nights=args.chunk_nights, ar1_kernel=ar1_kernel,
+                   **config)
+
+    if isinstance(output_fps, list):
+        for fp in output_fps:
+            fp.close()
     output_fp.close()
 
     return 0
@@ -277,9 +1314,807 @@ SeeingSample = namedtuple(
     'SeeingSample',
     ['mjd', 'elapsed_seconds', 'r0', 'seeing', 'kol_seeing', 'dimm_time'])
 
+# a time grid with its samples assigned to nights; the night_ and
+# _night fields describe blocks of consecutive samples in a night
+NightLayout = namedtuple(
+    'NightLayout',
+    ['grid_index', 'dt', 'mjd', 'night_mjd', 'first_night', 'night_start',
+     'night_index', 'samples_per_night', 'sample_in_night'])
+
+
+class SeeingHDF5Writer:
+    """Write blocks of seeing values to a chunked HDF5 table.
+
+    The table is written with pandas.HDFStore in "table" format, one
+    append per block, so it can be read back with selections on rows
+    or columns, e.g. pd.read_hdf(fname, columns=['mjd', 'seeing']).
+    Artificial samples have NaT in the dimm_time column.
+    """
+
+    def __init__(self, fname, key='seeing'):
+        import pandas as pd
+        self.key = key
+        self.store = pd.HDFStore(fname, mode='w', complevel=1,
+                                 complib='blosc')
+
+    def write(self, samples):
+        """Append a numpy structured array of samples to the table."""
+        import pandas as pd
+        df = pd.DataFrame(samples)
+        if 'dimm_time' in df:
+            df['dimm_time'] = df['dimm_time'].astype('datetime64[ns]')
+        self.store.append(self.key, df, format='table', index=False,
+                          data_columns=['mjd'])
+
+    def close(self):
+        """Index the table and close the file."""
+        if self.key in self.store:
+            self.store.create_table_index(self.key, columns=['mjd'])
+        self.store.close()
+
+
+class SeeingParquetWriter:
+    """Write blocks of seeing values to a Parquet file.
+
+    Each block becomes a row group. Artificial samples have null
+    values in the dimm_time column. Requires pyarrow.
+    """
+
+    def __init__(self, fname):
+        import pyarrow
+        import pyarrow.parquet
+        self.pyarrow = pyarrow
+        self.fname = fname
+        self.writer = None
+
+    def write(self, samples):
+        """Write a numpy structured array of samples as a row group."""
+        table = self.pyarrow.table(
+            {name: self.pyarrow.array(np.ascontiguousarray(samples[name]),
+                                      from_pandas=True)
+             for name in samples.dtype.names})
+        if self.writer is None:
+            self.writer = self.pyarrow.parquet.ParquetWriter(self.fname,
+                                                             table.schema)
+        self.writer.write_table(table)
+
+    def close(self):
+        """Close the file."""
+        if self.writer is not None:
+            self.writer.close()
+
+
+class SeeingNpyWriter:
+    """Write blocks of seeing values to a directory of .npy column files.
+
+    Each column is written to its own file (e.g. seeing.npy), which can
+    be memory mapped when read back, e.g. np.load(fname, mmap_mode='r').
+    Artificial samples have NaT in dimm_time.npy.
+    """
+
+    # Reserve enough space in the header for any shape, so that it
+    # can be rewritten in place when the final length is known.
+    header_length = 128
+
+    def __init__(self, dirname):
+        os.makedirs(dirname, exist_ok=True)
+        self.dirname = dirname
+        self.fps = {}
+        self.length = 0
+
+    def write(self, samples):
+        """Append a numpy structured array of samples to the column files."""
+        if len(self.fps) == 0:
+            for name in samples.dtype.names:
+                fp = open(os.path.join(self.dirname, name + '.npy'), 'wb')
+                # without any metadata (e.g. from pickling across
+                # processes), which npy headers cannot record
+                self.fps[name] = (fp, np.dtype(samples.dtype[name].str))
+                self._write_header(name)
+
+        for name, (fp, dtype) in self.fps.items():
+            fp.write(np.ascontiguousarray(samples[name], dtype=dtype).tobytes())
+        self.length += len(samples)
+
+    def close(self):
+        """Record the final lengths in the headers and close the files."""
+        for name, (fp, _) in self.fps.items():
+            fp.seek(0)
+            self._write_header(name)
+            fp.close()
+
+    def _write_header(self, name):
+        fp, dtype = self.fps[name]
+        header = repr({'descr': np.lib.format.dtype_to_descr(dtype),
+                       'fortran_order': False,
+                       'shape': (self.length,)})
+        prefix = np.lib.format.magic(1, 0)
+        padding = self.header_length - len(prefix) - 2 - len(header) - 1
+        fp.write(prefix + struct.pack('<H', self.header_length - len(prefix) - 2)
+                 + (header + ' '*padding + '\n').encode('latin1'))
+
+
+class SeeingColumns:
+    """Seeing samples held compactly, with a numpy array for each column.
+
+    The columns, with their types, are those in compact_seeing_dtypes:
+    r0 and the seeing are single precision, measured is False for
+    artificial samples, and dimm_time is the time of the DIMM
+    measurement in nanoseconds since 1970 (NaT for artificial samples,
+    when viewed as datetime64[ns]). Each sample takes 37 bytes.
+
+    Indexing with a column name gives the array of that column; with an
+    integer, a SeeingSample; and with a slice, boolean mask, or array of
+    indexes, a new SeeingColumns (sharing memory with this one, for a
+    slice). Iterating gives SeeingSample tuples, as simsee.seeing does.
+
+    >>> samples = seeing_arrays(61100.0, 61101.0, 300,
+    ...                         20,
+    ...                         -0.9424, 0.058, 296.5, 0.3, 0.09, 0.7, 0.053,
+    ...                         random_seed=6563)
+    ...
+    >>> columns = SeeingColumns.from_samples(samples)
+    >>> len(columns), columns.nbytes
+    (289, 10693)
+    >>> columns[1] # doctest: +ELLIPSIS
+    SeeingSample(mjd=61100.00347..., elapsed_seconds=300, r0=0.10043..., seeing=0.82274..., kol_seeing=1.00999..., dimm_time='artificial')
+    >>> columns[10:12].to_pandas()[['mjd', 'seeing', 'measured']]
+                mjd    seeing  measured
+    0  61100.034722  0.570490     False
+    1  61100.038194  0.579621     False
+    >>> np.shares_memory(columns[10:12]['seeing'], columns['seeing'])
+    True
+    """
+
+    def __init__(self, columns):
+        """Collect columns into a SeeingColumns.
+
+        Args:
+            columns: a mapping with an array for each column in
+                compact_seeing_dtypes; arrays that are already
+                contiguous and of the right type are not copied
+        """
+        self.columns = {name: np.ascontiguousarray(columns[name], dtype=dtype)
+                        for name, dtype in compact_seeing_dtypes.items()}
+        if len({len(values) for values in self.columns.values()}) > 1:
+            raise ValueError("Seeing columns differ in length")
+
+    @classmethod
+    def from_samples(cls, samples):
+        """Convert a numpy structured array with dtype seeing_dtype."""
+        dimm_time = samples['dimm_time'].astype('datetime64[ns]')
+        columns = {name: samples[name] for name in seeing_dtype.names
+                   if name != 'dimm_time'}
+        columns['measured'] = ~np.isnat(dimm_time)
+        columns['dimm_time'] = dimm_time.view(np.int64)
+        return cls(columns)
+
+    @classmethod
+    def from_blocks(cls, blocks):
+        """Convert and join blocks of samples, e.g. from simsee.seeing_chunks.
+
+        Args:
+            blocks: an iterable of numpy structured arrays with dtype
+                seeing_dtype
+
+        Each block is converted as it is read, so the full precision
+        samples need not all be held in memory at once.
+        """
+        parts = [cls.from_samples(samples) for samples in blocks]
+        return cls({name: np.concatenate([part.columns[name]
+                                          for part in parts])
+                    if parts else np.empty(0, dtype)
+                    for name, dtype in compact_seeing_dtypes.items()})
+
+    @classmethod
+    def read_text(cls, fname, chunksize=2**20):
+        """Read seeing samples written as text by simsee.
+
+        Args:
+            fname: the name of the text file (compressed if it ends
+                in .gz, .bz2, or .xz)
+            chunksize: the number of lines parsed at a time
+
+        Returns:
+            a SeeingColumns
+        """
+        import pandas as pd
+        dtypes = dict(compact_seeing_dtypes, dimm_time=str)
+        del dtypes['measured']
+
+        def frame_samples(frame):
+            measured = (frame['dimm_time'] != 'artificial').values
+            dimm_time = np.full(len(frame), np.datetime64('NaT'),
+                                dtype='datetime64[ns]')
+            dimm_time[measured] = pd.to_datetime(
+                frame['dimm_time'].values[measured], format='ISO8601')
+            samples = np.empty(len(frame), dtype=seeing_dtype)
+            for name in seeing_dtype.names:
+                samples[name] = dimm_time if name == 'dimm_time' \
+                    else frame[name].values
+            return samples
+
+        with pd.read_csv(fname, sep='\t', dtype=dtypes,
+                         usecols=list(SeeingSample._fields),
+                         float_precision='round_trip',
+                         chunksize=chunksize) as reader:
+            return cls.from_blocks(frame_samples(frame) for frame in reader)
+
+    @property
+    def nbytes(self):
+        """The number of bytes in the column arrays."""
+        return sum(values.nbytes for values in self.columns.values())
+
+    def __len__(self):
+        return len(self.columns['mjd'])
+
+    def __getitem__(self, index):
+        if isinstance(index, str):
+            return self.columns[index]
+        if isinstance(index, (int, np.integer)):
+            index = range(len(self))[index]
+            return next(self._records(slice(index, index + 1)))
+        return SeeingColumns({name: values[index]
+                              for name, values in self.columns.items()})
+
+    def __iter__(self):
+        block_length = 2**16
+        for start in range(0, len(self), block_length):
+            yield from self._records(slice(start, start + block_length))
+
+    def dimm_datetime(self):
+        """Get the DIMM times as a numpy datetime64[ns] array, without copying."""
+        return self.columns['dimm_time'].view('datetime64[ns]')
+
+    def to_samples(self):
+        """Copy the samples into a numpy structured array with dtype seeing_dtype."""
+        samples = np.empty(len(self), dtype=seeing_dtype)
+        for name in seeing_dtype.names:
+            samples[name] = self.dimm_datetime() if name == 'dimm_time' \
+                else self.columns[name]
+        return samples
+
+    def to_pandas(self):
+        """Get the samples as a pandas.DataFrame that shares their memory."""
+        import pandas as pd
+        columns = dict(self.columns, dimm_time=self.dimm_datetime())
+        return pd.DataFrame(columns, copy=False)
+
+    def _records(self, index):
+        dimm_time = np.datetime_as_string(
+            self.dimm_datetime()[index].astype('datetime64[s]'))
+        dimm_time = np.where(self.columns['measured'][index], dimm_time,
+                             'artificial')
+        values = [self.columns[name][index].tolist()
+                  for name in SeeingSample._fields[:-1]]
+        return map(SeeingSample._make, zip(*values, dimm_time.tolist()))
+
+
+class StageRecord:
+    """The totals for one stage recorded by a StageTimer."""
+
+    __slots__ = ('seconds', 'calls', 'samples', 'nbytes')
+
+    def __init__(self):
+        self.seconds = 0.0
+        self.calls = 0
+        self.samples = 0
+        self.nbytes = 0
+
+
+class StageTimer:
+    """Record the wall time, samples, and bytes of each stage of a run.
+
+    Stages are timed with simsee.profile_stage, which does nothing
+    unless simsee.stage_timer is set to a StageTimer. Time spent in a
+    stage nested within another is counted only for the inner stage.
+
+    >>> timer = StageTimer()
+    >>> with timer.stage('format', samples=1000):
+    ...     with timer.stage('write', nbytes=20):
+    ...         pass
+    ...
+    >>> sorted(timer.summary()['stages'])
+    ['format', 'write']
+    >>> timer.summary()['stages']['format']['samples']
+    1000
+    """
+
+    def __init__(self):
+        self.start_time = time.perf_counter()
+        self.stages = defaultdict(StageRecord)
+        self._nested_seconds = []
+
+    @contextmanager
+    def stage(self, name, samples=0, nbytes=0):
+        """Time a stage, adding the samples and bytes it handles.
+
+        Args:
+            name: the name of the stage
+            samples: the number of samples the stage handles
+            nbytes: the number of bytes the stage handles
+
+        Returns:
+            a context manager that gives the StageRecord of the stage,
+            to which counts not known in advance can be added
+        """
+        record = self.stages[name]
+        record.samples += samples
+        record.nbytes += nbytes
+        self._nested_seconds.append(0.0)
+        start_time = time.perf_counter()
+        try:
+            yield record
+        finally:
+            seconds = time.perf_counter() - start_time
+            record.seconds += seconds - self._nested_seconds.pop()
+            record.calls += 1
+            if self._nested_seconds:
+                self._nested_seconds[-1] += seconds
+
+    def summary(self):
+        """Summarize the stages as a dictionary that can be saved as JSON."""
+        total_seconds = time.perf_counter() - self.start_time
+        stages = {}
+        for name, record in self.stages.items():
+            stats = {'seconds': record.seconds, 'calls': record.calls}
+            if record.samples > 0:
+                stats['samples'] = record.samples
+                stats['samples_per_second'] = \
+                    record.samples/record.seconds if record.seconds > 0 else None
+            if record.nbytes > 0:
+                stats['bytes'] = record.nbytes
+                stats['bytes_per_second'] = \
+                    record.nbytes/record.seconds if record.seconds > 0 else None
+            stages[name] = stats
+
+        return {'total_seconds': total_seconds,
+                'untimed_seconds': total_seconds - sum(
+                    record.seconds for record in self.stages.values()),
+                'stages': stages}
+
+
+seeing_writers = {'hdf5': SeeingHDF5Writer,
+                  'parquet': SeeingParquetWriter,
+                  'npy': SeeingNpyWriter}
+
 # internal functions & classes
 
 
+def profile_stage(name, samples=0, nbytes=0):
+    """Time a stage of the run, if it is being profiled.
+
+    Args:
+        name: the name of the stage
+        samples: the number of samples the stage handles
+        nbytes: the number of bytes the stage handles
+
+    Returns:
+        a context manager that gives a StageRecord, to which counts not
+        known in advance can be added; if simsee.stage_timer is None,
+        the record is discarded and nothing is timed
+    """
+    if stage_timer is None:
+        return nullcontext(StageRecord())
+    return stage_timer.stage(name, samples, nbytes)
+
+
+def seeing_records(samples):
+    """Iterate over a block of seeing values as SeeingSample tuples.
+
+    Args:
+        samples: a numpy structured array with dtype seeing_dtype
+
+    Returns:
+        a generator of SeeingSample namedtuples
+    """
+    for values in samples.tolist():
+        dimm_time = 'artificial' if values[-1] is None \
+            else values[-1].isoformat()
+        yield SeeingSample(*values[:-1], dimm_time)
+
+
+def format_seeing(samples):
+    """Format a block of seeing values as tab separated text.
+
+    Args:
+        samples: a numpy structured array with dtype seeing_dtype,
+            perhaps with additional integer columns
+
+    Returns:
+        a string with one line per sample
+
+    The text is the same as csv.writer(fp, delimiter="\\t") writes for
+    the rows from simsee.seeing_records, but the whole block is
+    formatted with a single string formatting operation.
+
+    >>> samples = np.zeros(2, dtype=seeing_dtype)
+    >>> samples['mjd'] = [61100.0, 61100.5]
+    >>> samples['dimm_time'] = [np.datetime64('NaT'),
+    ...                         np.datetime64('2005-01-01T00:31:06')]
+    >>> format_seeing(samples)
+    '61100.0\\t0\\t0.0\\t0.0\\t0.0\\tartificial\\r\\n61100.5\\t0\\t0.0\\t0.0\\t0.0\\t2005-01-01T00:31:06\\r\\n'
+    """
+    columns = []
+    field_formats = []
+    for name in samples.dtype.names:
+        values = samples[name]
+        if values.dtype.kind == 'M':
+            dimm_time = np.datetime_as_string(values.astype('datetime64[s]'))
+            values = np.where(np.isnat(values), 'artificial', dimm_time)
+            field_formats.append('%s')
+        elif values.dtype.kind == 'f':
+            field_formats.append('%r')
+        else:
+            field_formats.append('%d')
+        columns.append(values.tolist())
+
+    line_format = '\t'.join(field_formats) + '\r\n'
+    return (line_format*len(samples)) % tuple(
+        itertools.chain.from_iterable(zip(*columns)))
+
+
+def format_ensemble(samples):
+    """Format each realization in an ensemble as tab separated text.
+
+    Args:
+        samples: a 2-dimensional numpy structured array with dtype
+            seeing_dtype, with one row for each realization
+
+    Returns:
+        a list of strings, one for each realization
+    """
+    return [format_seeing(realization) for realization in samples]
+
+
+def format_stacked_ensemble(samples):
+    """Format an ensemble as tab separated text, with a realization column.
+
+    Args:
+        samples: a 2-dimensional numpy structured array with dtype
+            seeing_dtype, with one row for each realization
+
+    Returns:
+        a string with one line per sample and realization
+    """
+    return format_seeing(stack_ensemble(samples))
+
+
+def stack_ensemble(samples, first_realization=0):
+    """Stack the realizations in an ensemble, adding a realization column.
+
+    Args:
+        samples: a 2-dimensional numpy structured array with dtype
+            seeing_dtype, with one row for each realization
+        first_realization: the realization number of the first row
+
+    Returns:
+        a 1-dimensional numpy structured array with a realization
+        column followed by the columns of seeing_dtype
+
+    >>> samples = np.zeros((2, 3), dtype=seeing_dtype)
+    >>> stack_ensemble(samples, 4)['realization']
+    array([4, 4, 4, 5, 5, 5])
+    """
+    stacked_dtype = np.dtype([('realization', np.int64)] + seeing_dtype.descr)
+    stacked = np.empty(samples.size, dtype=stacked_dtype)
+    stacked['realization'] = np.repeat(
+        np.arange(first_realization, first_realization + samples.shape[0]),
+        samples.shape[1])
+    for name in seeing_dtype.names:
+        stacked[name] = samples[name].ravel()
+    return stacked
+
+
+def write_seeing_checkpoint(fname, nightly_offsets, **kwargs):
+    """Save what simsee.resume_seeing needs to extend a data set.
+
+    Args:
+        fname: the name of the checkpoint file
+        nightly_offsets: the nightly offsets used to generate the data,
+            starting with the night of start_mjd
+
+    The remaining arguments are those with which the data was generated,
+    as in simsee.sim_seeing. The checkpoint is a small JSON file with
+    the parameters, and the time, elapsed seconds, night, and nightly
+    offset of the last sample.
+    """
+    start_mjd, end_mjd, freq = kwargs['start_mjd'], kwargs['end_mjd'], \
+        kwargs['freq']
+    first_night = calc_night_mjd(start_mjd)
+    last_night = calc_night_mjd(end_mjd)
+    grid_index = time_grid(start_mjd, end_mjd, freq,
+                           (max(first_night, last_night - 1), last_night),
+                           kwargs.get('max_sun_altitude'))
+    if len(grid_index) == 0:
+        raise ValueError("There are no samples to checkpoint")
+
+    last_mjd = start_mjd + freq*grid_index[-1]/(24.0*60.0*60.0)
+    night_mjd = int(calc_night_mjd(last_mjd))
+    checkpoint = {
+        'version': checkpoint_version,
+        'params': {key: kwargs.get(key, default)
+                   for key, default in checkpoint_defaults.items()},
+        'end_mjd': end_mjd,
+        'mjd': last_mjd,
+        'elapsed_seconds': int(kwargs.get('start_elapsed_seconds', 0)
+                               + freq*grid_index[-1]),
+        'night_mjd': night_mjd,
+        'nightly_offset': float(np.ravel(nightly_offsets)[night_mjd
+                                                          - first_night])}
+
+    # Replace any old checkpoint only once the new one is complete
+    temp_fname = fname + '.tmp'
+    with open(temp_fname, 'w') as fp:
+        json.dump(checkpoint, fp, indent=1)
+    os.replace(temp_fname, fname)
+
+
+def read_seeing_checkpoint(fname):
+    """Read a checkpoint written by simsee.write_seeing_checkpoint.
+
+    Args:
+        fname: the name of the checkpoint file
+
+    Returns:
+        a dictionary with the checkpoint
+    """
+    with open(fname, 'r') as fp:
+        checkpoint = json.load(fp)
+
+    if checkpoint.get('version') != checkpoint_version:
+        raise ValueError("Checkpoint {0} has an unsupported version".format(
+            fname))
+
+    return checkpoint
+
+
+def open_output(fname=None, buffer_size=2**20, append=False):
+    """Open a text stream for output.
+
+    Args:
+        fname: the name of the file to write, or None or - for standard
+            output, or tcp://host:port to send the output to a socket
+        buffer_size: the size of the write buffer, in bytes
+        append: append to the file rather than replacing it
+
+    Returns:
+        a text file object
+
+    Files whose names end in .gz, .bz2, or .xz are compressed.
+    Closing the returned object flushes, but does not close, standard
+    output. Writes block when the destination (e.g. a pipe or socket)
+    is not accepting data, so a slow consumer slows the producer rather
+    than causing output to accumulate in memory.
+    """
+    mode = 'ab' if append else 'wb'
+    if fname is None or fname == '-':
+        sys.stdout.flush()
+        raw = io.FileIO(sys.stdout.fileno(), 'wb', closefd=False)
+    elif fname.startswith('tcp://'):
+        import socket
+        host, port = fname[len('tcp://'):].rsplit(':', 1)
+        with closing(socket.create_connection((host, int(port)))) as sock:
+            # The file keeps the connection open until it is closed.
+            raw = sock.makefile('wb', buffering=0)
+    elif fname.endswith('.gz'):
+        import gzip
+        raw = gzip.open(fname, mode)
+    elif fname.endswith('.bz2'):
+        import bz2
+        raw = bz2.open(fname, mode)
+    elif fname.endswith('.xz'):
+        import lzma
+        raw = lzma.open(fname, mode)
+    else:
+        raw = io.FileIO(fname, mode)
+
+    return io.TextIOWrapper(io.BufferedWriter(raw, buffer_size),
+                            encoding='ascii', newline='')
+
+
+def write_sweep_index(fp, sweep, fnames):
+    """Write a table of the variants in a sweep and their output files.
+
+    Args:
+        fp: the file pointer to the file to write
+        sweep: the variants, as returned by simsee.parse_sweep_config
+        fnames: the output file name of each variant
+    """
+    keys = []
+    for name, overrides in sweep:
+        keys.extend(key for key in overrides if key not in keys)
+
+    writer = csv.writer(fp, delimiter="\t")
+    writer.writerow(['variant', 'name', 'output']
+                    + ['.'.join(key) for key in keys])
+    for variant, ((name, overrides), fname) in enumerate(zip(sweep, fnames)):
+        writer.writerow([variant, name, fname]
+                        + [overrides.get(key, '') for key in keys])
+
+
+def seeing_chunk(formatter, kwargs):
+    """Generate (and optionally format) one chunk for simsee.seeing_chunks.
+
+    Args:
+        formatter: a function to apply to the chunk, or None
+        kwargs: keyword arguments for simsee.seeing_arrays, or
+            simsee.seeing_ensemble if they include random_seeds, or
+            simsee.seeing_sweep if they include variants
+
+    Returns:
+        the chunk, or the result of applying formatter to it
+    """
+    with profile_stage('generate') as stage:
+        if 'random_seeds' in kwargs:
+            samples = seeing_ensemble(**kwargs)
+        elif 'variants' in kwargs:
+            samples = seeing_sweep(**kwargs)
+        else:
+            samples = seeing_arrays(**kwargs)
+        stage.samples += samples.size
+
+    if formatter is None:
+        return samples
+    with profile_stage('format', samples.size):
+        return formatter(samples)
+
+
+def night_layout(start_mjd, end_mjd, freq, nights=None, num_nights=None,
+                 max_sun_altitude=None):
+    """Build a time grid and assign its samples to nights.
+
+    Args:
+        start_mjd: the MJD of the first generated seeing value
+        end_mjd: the MJD of the last generated seeing value
+        freq: seconds between generated seeing values
+        nights: a tuple with the first and last night MJD to include,
+            or None to include all nights from start_mjd to end_mjd
+        num_nights: the number of nights (starting with that of
+            start_mjd) for which samples are wanted, or None for all
+        max_sun_altitude: include only samples taken while the sun is
+            below this altitude (in degrees), or None for all
+
+    Returns:
+        a NightLayout
+
+    Each night is one block of consecutive samples, unless samples
+    are missing from the grid (because of max_sun_altitude), in which
+    case it is split where they are missing.
+    """
+    seconds_per_day = 24.0*60.0*60.0
+
+    # Build the time grid
+    grid_index = time_grid(start_mjd, end_mjd, freq, nights,
+                           max_sun_altitude)
+    dt = freq*grid_index
+    mjd = start_mjd + dt/seconds_per_day
+
+    # Assign samples to nights
+    night_mjd = calc_night_mjd(mjd)
+    first_night = calc_night_mjd(start_mjd)
+    if num_nights is not None:
+        # Drop nights for which we have no nightly offset
+        in_offsets = night_mjd < first_night + num_nights
+        grid_index, dt = grid_index[in_offsets], dt[in_offsets]
+        mjd, night_mjd = mjd[in_offsets], night_mjd[in_offsets]
+
+    new_night = np.ones(len(mjd), dtype=bool)
+    new_night[1:] = (night_mjd[1:] > night_mjd[:-1]) \
+        | (grid_index[1:] > grid_index[:-1] + 1)
+    night_start = np.flatnonzero(new_night)
+    night_index = np.cumsum(new_night) - 1
+    samples_per_night = np.diff(np.append(night_start, len(mjd)))
+    sample_in_night = np.arange(len(mjd)) - night_start[night_index]
+
+    return NightLayout(grid_index, dt, mjd, night_mjd, first_night,
+                       night_start, night_index, samples_per_night,
+                       sample_in_night)
+
+
+def as_offset_rows(nightly_offsets):
+    """Convert nightly offsets to a 2-dimensional array of floats."""
+    if not isinstance(nightly_offsets, np.ndarray):
+        nightly_offsets = list(nightly_offsets)
+    return np.atleast_2d(np.asarray(nightly_offsets, dtype=float))
+
+
+def sample_normals(random_seed, layout, start_elapsed_seconds=0):
+    """Draw the standard normal values for the sample AR1 series.
+
+    Args:
+        random_seed: the seed from which random streams are derived
+        layout: the NightLayout of the samples
+        start_elapsed_seconds: elapsed seconds at the start of the grid
+
+    Returns:
+        a numpy array with, for each night, a draw for the starting
+        value of the series followed by a draw for each sample
+    """
+    num_nights = len(layout.night_start)
+    draws = np.empty(len(layout.mjd) + num_nights)
+    night_first_draw = layout.night_start + np.arange(num_nights)
+    for night, elapsed, first_draw, num_samples in zip(
+            layout.night_mjd[layout.night_start],
+            start_elapsed_seconds + layout.dt[layout.night_start],
+            night_first_draw,
+            layout.samples_per_night):
+        rng = night_rng(random_seed, night, sample_stream_key, elapsed)
+        rng.standard_normal(out=draws[first_draw:first_draw+num_samples+1])
+
+    return draws
+
+
+def model_seeing(layout, draws, nightly_offsets,
+                 outer_scale, mean_log_r0,
+                 seasonal_amplitude, seasonal_phase,
+                 sample_coeff, sample_innovation,
+                 init_sample_offset=None, start_elapsed_seconds=0,
+                 ar1_kernel='lfilter'):
+    """Calculate seeing samples from the model and random draws.
+
+    Args:
+        layout: the NightLayout of the samples
+        draws: standard normal draws as from simsee.sample_normals,
+            one row for each series
+        nightly_offsets: the nightly offsets, starting with the night
+            of the start of the grid, one row for each series
+
+    The remaining arguments are as in simsee.seeing_arrays.
+
+    Returns:
+        a 2-dimensional numpy structured array with dtype seeing_dtype,
+        with one row for each series
+    """
+    num_series = draws.shape[0]
+    num_nights = len(layout.night_start)
+    night_index = layout.night_index
+    sample_in_night = layout.sample_in_night
+
+    night_first_draw = layout.night_start + np.arange(num_nights)
+    init_sample_offsets = draws[:, night_first_draw] \
+        * sample_innovation/np.sqrt(1 - sample_coeff**2)
+    if init_sample_offset is not None and len(layout.mjd) > 0 \
+            and layout.grid_index[0] == 0:
+        init_sample_offsets[:, 0] = init_sample_offset
+
+    sample_draw = np.arange(len(layout.mjd)) + night_index + 1
+    if ar1_kernel_name(ar1_kernel) == 'numba':
+        # The compiled kernel restarts the series at the start of each
+        # night itself, so no padding is needed.
+        sample_innovations = sample_innovation*draws[:, sample_draw]
+        sample_offsets = np.empty_like(sample_innovations)
+        compiled_ar1_segments()(sample_coeff, sample_innovations,
+                                layout.night_start, init_sample_offsets,
+                                sample_offsets)
+    else:
+        sample_innovations = np.zeros(
+            (num_series, num_nights, max(layout.samples_per_night, default=0)))
+        sample_innovations[:, night_index, sample_in_night] = \
+            sample_innovation*draws[:, sample_draw]
+        sample_offsets = ar1_array(sample_coeff, sample_innovations,
+                                   init_sample_offsets)
+        sample_offsets = sample_offsets[:, night_index, sample_in_night]
+
+    mjd = layout.mjd
+    night_start = layout.night_start
+    season_log_r0 = mean_log_r0 + year_cos(mjd[night_start] + 0.5,
+                                           seasonal_phase, seasonal_amplitude)
+    night_log_r0 = (season_log_r0
+                    + nightly_offsets[:, layout.night_mjd[night_start]
+                                      - layout.first_night])
+    log_r0 = night_log_r0[:, night_index] + sample_offsets
+
+    samples = np.empty((num_series, len(mjd)), dtype=seeing_dtype)
+    samples['mjd'] = mjd
+    samples['elapsed_seconds'] = start_elapsed_seconds + layout.dt
+    samples['r0'] = np.power(10, log_r0)
+    samples['seeing'] = vk_seeing(samples['r0'], outer_scale)
+    samples['kol_seeing'] = np.round(kol_seeing(samples['r0']), 2)
+    samples['dimm_time'] = np.datetime64('NaT')
+    return samples
+
+
 def ar1(coeff, innovation, initial_value=0.0):
     """Generate the next value in an AR1 time series.
 
@@ -324,6 +2159,281 @@ def ar1(coeff, innovation, initial_value=0.0):
         yield value
 
 
+def ar1_array(coeff, innovations, initial_value=0.0):
+    """Calculate AR1 time series from arrays of innovations.
+
+    Args:
+        coeff: the regression coefficient (phi in Cryer and Chan)
+        innovations: the innovations (e in Cryer and Chan), with
+            time along the last axis
+        initial_value: the value preceding the first in the time series,
+            with one value for each series
+
+    Returns:
+        a numpy array with the time series
+
+    >>> ar1_array(0.5, np.array([1.0, 0.0, 2.0]), 4.0)
+    array([3.  , 1.5 , 2.75])
+    >>> ar1_array(0.5, np.array([[1.0, 0.0], [0.0, 0.0]]), [4.0, 2.0])
+    array([[3. , 1.5],
+           [1. , 0.5]])
+    """
+    innovations = np.asarray(innovations, dtype=float)
+    if innovations.size == 0:
+        return np.zeros(innovations.shape)
+
+    import scipy.signal
+    zi = coeff*np.asarray(initial_value, dtype=float)[..., np.newaxis]
+    zi = np.broadcast_to(zi, innovations.shape[:-1] + (1,))
+    values, _ = scipy.signal.lfilter([1.0], [1.0, -coeff], innovations,
+                                     zi=zi)
+    return values
+
+
+def ar1_segments(coeff, innovations, segment_start, initial_values,
+                 kernel='lfilter'):
+    """Calculate consecutive AR1 time series, each with its own start.
+
+    Args:
+        coeff: the regression coefficient (phi in Cryer and Chan)
+        innovations: a 1-dimensional array of innovations for all segments
+        segment_start: the index of the first innovation of each segment
+        initial_values: the value preceding the first in each segment
+        kernel: the kernel that calculates the series
+            (see simsee.ar1_kernel_name)
+
+    Returns:
+        a numpy array with the time series
+
+    With the lfilter kernel, segments with similar lengths are padded
+    to a common length and filtered together.
+
+    >>> ar1_segments(0.5, np.array([1.0, 0.0, 2.0, 0.0]), [0, 2], [4.0, 2.0])
+    array([3. , 1.5, 3. , 1.5])
+    """
+    innovations = np.asarray(innovations, dtype=float)
+    segment_start = np.asarray(segment_start, dtype=int)
+    initial_values = np.asarray(initial_values, dtype=float)
+    values = np.empty(len(innovations))
+    if len(innovations) == 0:
+        return values
+
+    if ar1_kernel_name(kernel) == 'numba':
+        compiled_ar1_segments()(coeff, innovations[np.newaxis, :],
+                                segment_start, initial_values[np.newaxis, :],
+                                values[np.newaxis, :])
+        return values
+
+    lengths = np.diff(np.append(segment_start, len(innovations)))
+    segment = np.repeat(np.arange(len(segment_start)), lengths)
+    position = np.arange(len(innovations)) - segment_start[segment]
+
+    width = np.power(2, np.ceil(np.log2(np.maximum(lengths, 1)))).astype(int)
+    for group_width in np.unique(width):
+        in_group = width == group_width
+        row = np.cumsum(in_group) - 1
+        in_group_value = in_group[segment]
+        value_row = row[segment[in_group_value]]
+        value_position = position[in_group_value]
+
+        group_innovations = np.zeros((np.count_nonzero(in_group), group_width))
+        group_innovations[value_row, value_position] = innovations[in_group_value]
+        group_values = ar1_array(coeff, group_innovations,
+                                 initial_values[in_group])
+        values[in_group_value] = group_values[value_row, value_position]
+
+    return values
+
+
+def ar1_kernel_name(kernel='auto'):
+    """Find the kernel to use to calculate segmented AR1 series.
+
+    Args:
+        kernel: lfilter (scipy.signal.lfilter), numba (a loop compiled
+            with numba), or auto (numba if it is installed, lfilter
+            otherwise)
+
+    Returns:
+        the name of the kernel, lfilter or numba
+
+    Both kernels add the same terms in the same order, so they give
+    identical series.
+
+    >>> ar1_kernel_name('lfilter')
+    'lfilter'
+    """
+    if kernel not in ar1_kernels:
+        raise ValueError("Unknown AR1 kernel {0}".format(kernel))
+
+    have_numba = importlib.util.find_spec('numba') is not None
+    if kernel == 'auto':
+        return 'numba' if have_numba else 'lfilter'
+    if kernel == 'numba' and not have_numba:
+        raise ImportError("The numba AR1 kernel requires numba")
+    return kernel
+
+
+@lru_cache(maxsize=None)
+def compiled_ar1_segments():
+    """Compile the numba kernel for segmented AR1 series.
+
+    Returns:
+        a function taking the coefficient, a 2-dimensional array of
+        innovations (one row for each series), the index of the first
+        innovation of each segment, a 2-dimensional array of the values
+        preceding each segment, and a 2-dimensional array in which
+        to put the results
+
+    The series are calculated in a single pass over the innovations,
+    restarting at the start of each segment. The compiled code is
+    cached on disk by numba, so it is compiled only once.
+    """
+    import numba
+
+    @numba.njit(cache=True, nogil=True)
+    def ar1_segments_kernel(coeff, innovations, segment_start,
+                            initial_values, values):
+        num_values = innovations.shape[1]
+        num_segments = len(segment_start)
+        for row in range(innovations.shape[0]):
+            for segment in range(num_segments):
+                if segment + 1 < num_segments:
+                    segment_end = segment_start[segment + 1]
+                else:
+                    segment_end = num_values
+                value = initial_values[row, segment]
+                for index in range(segment_start[segment], segment_end):
+                    value = innovations[row, index] + coeff*value
+                    values[row, index] = value
+
+    return ar1_segments_kernel
+
+
+def night_rng(random_seed, night_mjd, *keys):
+    """Get the random number generator for a night.
+
+    Args:
+        random_seed: the seed for the whole data set
+        night_mjd: the integer MJD of the night
+        keys: further integers distinguishing streams within the night
+
+    Returns:
+        a numpy.random.Generator
+
+    Each combination of arguments gives an independent stream,
+    derived with numpy.random.SeedSequence, so values for a night do
+    not depend on what was drawn for other nights.
+
+    >>> night_rng(6563, 61100).standard_normal() == \\
+    ...     night_rng(6563, 61100).standard_normal()
+    True
+    """
+    keys = [int(k) for k in (random_seed, night_mjd) + keys]
+    return np.random.default_rng(keys)
+
+
+def simulate_nightly_offsets(night_mjds, nightly_coeff, nightly_innovation,
+                             init_nightly_offset=0.0, random_seed=None):
+    """Simulate the AR1 series of nightly offsets.
+
+    Args:
+        night_mjds: the integer MJDs of consecutive nights
+        nightly_coeff: AR1 model coefficient for nightly variation
+        nightly_innovation: amplitude of nightly model variation in log10(r0)
+        init_nightly_offset: the nightly offset preceding the first night
+        random_seed: the seed from which random streams are derived
+
+    Returns:
+        a numpy array of offsets in log10(r0), one for each night
+    """
+    draws = nightly_normals(night_mjds, random_seed)
+    return ar1_array(nightly_coeff, nightly_innovation*draws,
+                     init_nightly_offset)
+
+
+def nightly_normals(night_mjds, random_seed=None):
+    """Draw the standard normal values for the nightly AR1 series.
+
+    Args:
+        night_mjds: the integer MJDs of the nights
+        random_seed: the seed from which random streams are derived
+
+    Returns:
+        a numpy array with one draw for each night
+    """
+    return np.array([night_rng(random_seed, night,
+                               nightly_stream_key).standard_normal()
+                     for night in night_mjds], dtype=float)
+
+
+def time_grid(start_mjd, end_mjd, freq, nights=None, max_sun_altitude=None):
+    """Find the samples in a time grid.
+
+    Args:
+        start_mjd: the MJD of the first sample in the grid
+        end_mjd: the latest MJD allowed in the grid
+        freq: seconds between samples
+        nights: a tuple with the first and last night MJD to include,
+            or None to include all samples up to end_mjd
+        max_sun_altitude: include only samples taken while the sun is
+            below this altitude (in degrees), or None for all
+
+    Returns:
+        a numpy array of integers i, such that the MJD of each sample
+        is start_mjd + i*freq/(24*60*60)
+
+    >>> time_grid(61100.0, 61101.0, 3600)
+    array([ 0,  1,  2,  3,  4,  5,  6,  7,  8,  9, 10, 11, 12, 13, 14, 15, 16,
+           17, 18, 19, 20, 21, 22, 23, 24])
+    >>> time_grid(61100.0, 61101.0, 3600, (61100, 61100))
+    array([ 8,  9, 10, 11, 12, 13, 14, 15, 16, 17, 18, 19, 20, 21, 22, 23, 24])
+    >>> time_grid(61100.0, 61101.0, 3600, max_sun_altitude=-12)
+    array([1, 2, 3, 4, 5, 6, 7, 8, 9])
+
+    Only the indexes of samples between dusk and dawn are generated
+    when max_sun_altitude is set, so the cost of the grid does not
+    depend on the length of the days.
+    """
+    seconds_per_day = 24.0*60.0*60.0
+    first_index = 0
+    last_index = int(np.floor((end_mjd - start_mjd)*seconds_per_day/freq)) + 1
+    if nights is not None:
+        # Allow a day of slop on either side, and filter exactly below
+        first_index = max(first_index, int(np.floor(
+            (nights[0] - 1 - start_mjd)*seconds_per_day/freq)))
+        last_index = min(last_index, int(np.ceil(
+            (nights[1] + 2 - start_mjd)*seconds_per_day/freq)))
+
+    if max_sun_altitude is None:
+        grid_index = np.arange(first_index, max(first_index, last_index + 1),
+                               dtype=np.int64)
+    else:
+        # The evening of each local date from before the first to after
+        # the last sample, and the samples from its dusk to next dawn
+        first_date = int(np.floor(start_mjd
+                                  + first_index*freq/seconds_per_day)) - 1
+        last_date = int(np.floor(start_mjd
+                                 + last_index*freq/seconds_per_day)) + 1
+        dusk, dawn = twilight_mjds(np.arange(first_date, last_date + 1),
+                                   max_sun_altitude)
+        first_dark = np.maximum(
+            np.ceil((dusk - start_mjd)*seconds_per_day/freq), first_index)
+        last_dark = np.minimum(
+            np.floor((dawn - start_mjd)*seconds_per_day/freq), last_index)
+        num_dark = np.maximum(last_dark - first_dark + 1, 0).astype(np.int64)
+        grid_index = np.arange(num_dark.sum(), dtype=np.int64) + np.repeat(
+            first_dark.astype(np.int64) - np.cumsum(num_dark) + num_dark,
+            num_dark)
+
+    mjd = start_mjd + freq*grid_index/seconds_per_day
+    in_grid = mjd <= end_mjd
+    if nights is not None:
+        night_mjd = calc_night_mjd(mjd)
+        in_grid &= (night_mjd >= nights[0]) & (night_mjd <= nights[1])
+
+    return grid_index[in_grid]
+
+
 def vk_seeing(r0, outer_scale=20.0, wavelength=5.0e-7):
     """Calculate the seeing using a von Karman model.
 
@@ -362,6 +2472,106 @@ def vk_seeing(r0, outer_scale=20.0, wavelength=5.0e-7):
     return seeing
 
 
+def kol_seeing(r0, wavelength=5.0e-7):
+    """Calculate the seeing using a Kolmogorov model.
+
+    Args:
+        r0: the Fried parameter, in meters
+        wavelength: the wavelength of light, in meters
+
+    Returns:
+        The PSF FWHM, in arcseconds
+
+    >>> kol_seeing(0.12) # doctest: +ELLIPSIS
+    0.842...
+    """
+    return 60*60*np.degrees(0.98*wavelength/r0)
+
+
+def twilight_mjds(evening_mjd, sun_altitude=-12.0,
+                  obs_lon=-70.8062, obs_lat=-30.2407):
+    """Calculate when the sun passes an altitude in the evening and morning.
+
+    Args:
+        evening_mjd: the integer MJDs of the local dates of the evenings
+        sun_altitude: the altitude of the sun (degrees), e.g. -12 for
+            nautical twilight
+        obs_lon: the observatory longitude (degrees East of lon=0)
+        obs_lat: the observatory latitude (degrees)
+
+    Returns:
+        a tuple of numpy arrays with the MJDs at which the sun sinks
+        below sun_altitude in each evening, and rises above it the
+        following morning
+
+    The position of the sun is calculated with the low precision
+    formulae of the Astronomical Almanac (good to about 0.01 degrees),
+    refined from local midnight by a few iterations. If the sun never
+    rises above (or sinks below) the altitude, both times are local
+    midnight (or a day apart).
+
+    >>> dusk, dawn = twilight_mjds([61100], -12)
+    >>> print(round(dusk[0], 4), round(dawn[0], 4))
+    61101.0065 61101.404
+    """
+    sidereal_degrees_per_day = 360.98564736629
+    sin_alt = np.sin(np.radians(sun_altitude))
+    sin_lat, cos_lat = np.sin(np.radians(obs_lat)), np.cos(np.radians(obs_lat))
+    midnight = np.asarray(evening_mjd, dtype=float) + 1 - obs_lon/360.0
+
+    times = []
+    for direction in (1, -1):
+        mjd = midnight
+        for iteration in range(4):
+            # Sun position at mjd (Astronomical Almanac, section C)
+            days = mjd - 51544.5
+            mean_lon = np.radians(280.460 + 0.9856474*days)
+            mean_anomaly = np.radians(357.528 + 0.9856003*days)
+            ecliptic_lon = mean_lon + np.radians(
+                1.915*np.sin(mean_anomaly) + 0.020*np.sin(2*mean_anomaly))
+            obliquity = np.radians(23.439 - 0.0000004*days)
+            ra = np.degrees(np.arctan2(np.cos(obliquity)*np.sin(ecliptic_lon),
+                                       np.cos(ecliptic_lon)))
+            dec = np.arcsin(np.sin(obliquity)*np.sin(ecliptic_lon))
+
+            # Hour angle at which the sun has the requested altitude,
+            # positive (west) in the evening and negative in the morning
+            cos_ha = (sin_alt - sin_lat*np.sin(dec))/(cos_lat*np.cos(dec))
+            ha = direction*np.degrees(np.arccos(np.clip(cos_ha, -1, 1)))
+            lst = 280.46061837 + sidereal_degrees_per_day*days + obs_lon
+            mjd = mjd + ((ha - (lst - ra) + 180) % 360 - 180) \
+                / sidereal_degrees_per_day
+        times.append(mjd)
+
+    return tuple(times)
+
+
+def sun_below(mjd, sun_altitude, obs_lon=-70.8062, obs_lat=-30.2407):
+    """Find which times are between dusk and dawn.
+
+    Args:
+        mjd: a numpy array of MJDs
+        sun_altitude: the altitude of the sun (degrees) at dusk and dawn
+        obs_lon: the observatory longitude (degrees East of lon=0)
+        obs_lat: the observatory latitude (degrees)
+
+    Returns:
+        a boolean numpy array, True where the sun is below sun_altitude
+
+    >>> sun_below(np.array([61100.5, 61101.2]), -12)
+    array([False,  True])
+    """
+    mjd = np.asarray(mjd, dtype=float)
+    if mjd.size == 0:
+        return np.zeros(mjd.shape, dtype=bool)
+
+    evening_mjd = np.arange(int(np.floor(mjd.min())) - 1,
+                            int(np.floor(mjd.max())) + 1)
+    dusk, dawn = twilight_mjds(evening_mjd, sun_altitude, obs_lon, obs_lat)
+    evening = np.searchsorted(dusk, mjd, side='right') - 1
+    return (evening >= 0) & (mjd <= dawn[np.maximum(evening, 0)])
+
+
 def calc_night_mjd(mjd, obs_lon=-70.8062):
     """Calculate the integer MJD designatating a night at Cerro Pachon.
 
@@ -394,7 +2604,7 @@ def interpolate_night_seeing(dimm, start_mjd, end_mjd,
                              mean_log_r0,
                              seasonal_amplitude, seasonal_phase,
                              nightly_coeff, nightly_innovation,
-                             random_seed=None):
+                             random_seed=None, ar1_kernel='lfilter'):
     """Get nightly seeing means, interpolating when necessary.
 
     Args:
@@ -407,71 +2617,112 @@ def interpolate_night_seeing(dimm, start_mjd, end_mjd,
             (peak r0 in days after November 17)
         nightly_coeff: AR1 model coefficient for nightly variation
         nightly_innovation: amplitude of nightly model variation in log10(r0)
-
+        random_seed: the seed from which random streams are derived
+        ar1_kernel: the kernel that calculates the AR1 series of missing
+            nights (see simsee.ar1_kernel_name)
 
     Returns:
         a pandas.Series with seeing values for every night
         from start_mjd to end_mjd
 
-    >>> dimm = load_dimm('pachon_dimm.h5')
+    >>> import pandas as pd
+    >>> dimm = pd.DataFrame({'night_mjd': [53080, 53080, 53081, 53084, 53085, 53089],
+    ...                      'log_r0': [-0.85, -0.87, -1.02, -0.91, -0.79, -0.95]})
     >>> interpolate_night_seeing(dimm, 53080, 53090, 0,
     ...                          -0.9424, 0.058, 296.5, 0.3, 0.09,
     ...                          6563)
-    ...
-    53080   -0.857619
-    53081   -1.165991
-    53082   -0.867227
-    53083   -0.935089
-    53084   -0.936177
-    53085   -1.086785
-    53086   -0.805879
-    53087   -0.905333
-    53088   -0.804373
-    53089   -0.847581
-    53090   -0.817402
+    53080   -0.860000
+    53081   -1.020000
+    53082   -1.089724
+    53083   -0.917256
+    53084   -0.910000
+    53085   -0.790000
+    53086   -1.006833
+    53087   -0.919625
+    53088   -1.056223
+    53089   -0.950000
+    53090   -1.137258
     dtype: float64
 
     """
-    if random_seed is not None:
-        np.random.seed(random_seed)
+    import pandas as pd
+    if random_seed is None:
+        random_seed = np.random.SeedSequence().entropy
 
     mjd_offset = int(round(year_length_days*years_offset))
 
-    def seasonal_offset(mjd):
-        return year_cos(mjd, seasonal_phase, seasonal_amplitude)
-
-    dimm_nights = dimm.groupby('night_mjd').agg({'log_r0': 'mean'})
-
-    mjds = []
-    log_r0s = []
-    nightly_offset = 0
-    for mjd in range(start_mjd, end_mjd+1):
-        try:
-            log_r0 = dimm_nights.loc[mjd-mjd_offset, 'log_r0']
-            season_log_r0 = mean_log_r0 + seasonal_offset(mjd + 0.5)
-            nightly_offset = log_r0 - season_log_r0
-        except KeyError:
-            nightly_offset = nightly_coeff * nightly_offset \
-                             + np.random.normal(0.0, nightly_innovation)
-            log_r0 = season_log_r0 + nightly_offset
-        mjds.append(mjd)
-        log_r0s.append(log_r0)
+    mjds = np.arange(start_mjd, end_mjd+1)
+    if 'night_log_r0' in dimm.attrs:
+        dimm_nights = dimm.attrs['night_log_r0']
+    else:
+        dimm_nights = dimm.groupby('night_mjd')['log_r0'].mean()
+    log_r0s = dimm_nights.reindex(mjds - mjd_offset).values
+    measured = ~np.isnan(log_r0s)
+    season_log_r0 = mean_log_r0 \
+        + year_cos(mjds + 0.5, seasonal_phase, seasonal_amplitude)
+    nightly_offsets = log_r0s - season_log_r0
+
+    # Nights without measurements continue the nightly AR1 series from
+    # the last measured night, relative to its seasonal mean.
+    last_measured = np.maximum.accumulate(
+        np.where(measured, np.arange(len(mjds)), -1))
+    missing = np.flatnonzero(~measured)
+    if len(missing) > 0:
+        missing_last_measured = last_measured[missing]
+        after_measured = missing_last_measured >= 0
+        run_start = np.flatnonzero(np.diff(missing, prepend=-2) > 1)
+        init_offsets = np.zeros(len(run_start))
+        run_after_measured = after_measured[run_start]
+        init_offsets[run_after_measured] = nightly_offsets[
+            missing_last_measured[run_start[run_after_measured]]]
+
+        draws = np.array([night_rng(random_seed, mjd,
+                                    nightly_stream_key).standard_normal()
+                          for mjd in mjds[missing]])
+        missing_offsets = ar1_segments(nightly_coeff,
+                                       nightly_innovation*draws,
+                                       run_start, init_offsets, ar1_kernel)
+
+        base_log_r0 = season_log_r0[missing]
+        base_log_r0[after_measured] = \
+            season_log_r0[missing_last_measured[after_measured]]
+        log_r0s[missing] = base_log_r0 + missing_offsets
 
     dimm_interp_nights = pd.Series(log_r0s, index=mjds)
 
     return dimm_interp_nights
 
 
-def load_dimm(fname, obs_lon=-70.8062, outer_scale=20):
+def load_dimm(fname, obs_lon=-70.8062, outer_scale=20, cache_dir=None,
+              start_mjd=None, end_mjd=None, chunksize=100000):
     """Load DIMM data from an HDF5 file and add derived colums.
 
     Args:
         fname: the name of the file from which to load DIMM data
         obs_lon: the observator longitude, in degrees east
+        outer_scale: the von Karman outer scale, in meters
+        cache_dir: a directory in which to cache the derived data,
+            or None to not use a cache
+        start_mjd: the MJD of the earliest measurement to load,
+            or None to start at the beginning of the file
+        end_mjd: load only measurements before this MJD,
+            or None to continue to the end of the file
+        chunksize: the number of rows to read from the file at a time
 
     Return:
         a pandas.DataFrame with the data
 
+    If the file is in HDF5 table format, only the rows in the
+    requested time window are read, chunksize rows at a time, and
+    each chunk is filtered before the next is read. Files in fixed
+    format must be read whole.
+
+    If cache_dir is set, the filtered data and derived columns are
+    saved there the first time they are calculated, and later calls
+    with the same file (unchanged), observatory longitude, and outer
+    scale read them from the cache instead. See simsee.read_dimm_cache.
+    The cache holds the whole file, and is sliced to the time window.
+
     >>> df = load_dimm('pachon_dimm.h5')
     >>> df[['seeing', 'r0', 'log_r0', 'vk_seeing']].head()
                          seeing        r0    log_r0  vk_seeing
@@ -491,7 +2742,84 @@ def load_dimm(fname, obs_lon=-70.8062, outer_scale=20):
     2004-03-17 02:37:58  53081.109699      53080
 
     """
-    dimm = pd.read_hdf(fname)
+    import pandas as pd
+    if cache_dir is not None:
+        cache_path = dimm_cache_path(fname, cache_dir, obs_lon, outer_scale)
+        if os.path.isdir(cache_path):
+            dimm = read_dimm_cache(cache_path)
+        else:
+            dimm = load_dimm(fname, obs_lon, outer_scale, chunksize=chunksize)
+            write_dimm_cache(dimm, cache_path)
+
+        in_window = np.ones(len(dimm), dtype=bool)
+        if start_mjd is not None:
+            in_window &= dimm.mjd.values >= start_mjd
+        if end_mjd is not None:
+            in_window &= dimm.mjd.values < end_mjd
+        return dimm if in_window.all() else dimm[in_window]
+
+    chunks = [derive_dimm_columns(raw_dimm, outer_scale)
+              for raw_dimm in read_dimm_chunks(fname, start_mjd, end_mjd,
+                                               chunksize)]
+    dimm = chunks[0] if len(chunks) == 1 else pd.concat(chunks)
+    return dimm
+
+
+def read_dimm_chunks(fname, start_mjd=None, end_mjd=None, chunksize=100000):
+    """Read raw DIMM data from an HDF5 file in chunks.
+
+    Args:
+        fname: the name of the file from which to read DIMM data
+        start_mjd: the MJD of the earliest measurement to read,
+            or None to start at the beginning of the file
+        end_mjd: read only measurements before this MJD,
+            or None to continue to the end of the file
+        chunksize: the number of rows in each chunk
+
+    Return:
+        a generator that yields pandas.DataFrames with the data,
+        at least one (which may be empty)
+    """
+    import pandas as pd
+    where = []
+    if start_mjd is not None:
+        where.append('index >= {0!r}'.format(mjd_to_timestamp(start_mjd)))
+    if end_mjd is not None:
+        where.append('index < {0!r}'.format(mjd_to_timestamp(end_mjd)))
+
+    with pd.HDFStore(fname, mode='r') as store:
+        key = store.keys()[0]
+        if not store.get_storer(key).is_table:
+            # Fixed format stores cannot be queried, so read the
+            # whole thing and select the window afterward
+            dimm = store.select(key)
+            if start_mjd is not None:
+                dimm = dimm[dimm.index >= mjd_to_timestamp(start_mjd)]
+            if end_mjd is not None:
+                dimm = dimm[dimm.index < mjd_to_timestamp(end_mjd)]
+            yield dimm
+            return
+
+        read_any = False
+        for dimm in store.select(key, where=where or None,
+                                 chunksize=chunksize):
+            read_any = True
+            yield dimm
+
+        if not read_any:
+            yield store.select(key, stop=0)
+
+
+def derive_dimm_columns(dimm, outer_scale=20):
+    """Filter raw DIMM data and add derived columns.
+
+    Args:
+        dimm: a pandas.DataFrame with a time index and a seeing column
+        outer_scale: the von Karman outer scale, in meters
+
+    Return:
+        a pandas.DataFrame with the data, as returned by simsee.load_dimm
+    """
     dimm = dimm.query('0.05 < seeing < 10.0').copy()
     dimm['r0'] = 0.98*5e-7/np.radians(dimm.seeing/(60*60))
     dimm['log_r0'] = np.log10(dimm.r0)
@@ -501,6 +2829,143 @@ def load_dimm(fname, obs_lon=-70.8062, outer_scale=20):
     return dimm
 
 
+def mjd_to_timestamp(mjd):
+    """Convert an MJD to a pandas.Timestamp.
+
+    Args:
+        mjd: the modified Julian date
+
+    Return:
+        the corresponding pandas.Timestamp
+
+    >>> mjd_to_timestamp(53081.5)
+    Timestamp('2004-03-17 12:00:00')
+    """
+    import pandas as pd
+    return pd.Timestamp('1858-11-17') + pd.to_timedelta(mjd, unit='D')
+
+
+def dimm_cache_path(fname, cache_dir, obs_lon, outer_scale):
+    """Get the path of the cache of derived data for a DIMM data file.
+
+    Args:
+        fname: the name of the DIMM data file
+        cache_dir: the directory holding caches
+        obs_lon: the observator longitude, in degrees east
+        outer_scale: the von Karman outer scale, in meters
+
+    Return:
+        the path of the cache directory for this file and these parameters
+    """
+    fname = os.path.abspath(fname)
+    stat = os.stat(fname)
+    key = repr((dimm_cache_version, fname, stat.st_mtime_ns, stat.st_size,
+                float(obs_lon), float(outer_scale)))
+    key_hash = hashlib.sha1(key.encode('utf-8')).hexdigest()[:16]
+    base_name = os.path.splitext(os.path.basename(fname))[0]
+    return os.path.join(cache_dir, '{0}_{1}'.format(base_name, key_hash))
+
+
+def write_dimm_cache(dimm, cache_path):
+    """Save DIMM data with derived columns as a directory of .npy files.
+
+    Args:
+        dimm: a pandas.DataFrame as returned by simsee.load_dimm
+        cache_path: the directory in which to save the data
+
+    The nightly means of log_r0, used by simsee.interpolate_night_seeing,
+    are saved as well.
+    """
+    cache_dir = os.path.dirname(cache_path)
+    os.makedirs(cache_dir, exist_ok=True)
+
+    # Write to a temporary directory and rename it, so that concurrent
+    # runs never see a partially written cache.
+    temp_path = tempfile.mkdtemp(dir=cache_dir)
+    columns = {name: dimm[name].values.astype(dtype)
+               for name, dtype in dimm_cache_dtypes.items()}
+    columns['time'] = dimm.index.values.astype('datetime64[s]')
+    night_log_r0 = dimm.groupby('night_mjd')['log_r0'].mean()
+    columns['night_log_r0_night_mjd'] = night_log_r0.index.values.astype(np.int32)
+    columns['night_log_r0'] = night_log_r0.values
+    for name, values in columns.items():
+        np.save(os.path.join(temp_path, name + '.npy'), values)
+
+    try:
+        os.rename(temp_path, cache_path)
+    except OSError:
+        # Another process got there first
+        shutil.rmtree(temp_path)
+
+
+def read_dimm_cache(cache_path):
+    """Read DIMM data saved by simsee.write_dimm_cache.
+
+    Args:
+        cache_path: the directory with the saved data
+
+    Return:
+        a pandas.DataFrame with the data, as returned by simsee.load_dimm,
+        but with only the derived and seeing columns
+
+    The columns are memory mapped from the .npy files. The nightly means
+    of log_r0 are attached as the pandas.Series dimm.attrs['night_log_r0'].
+    """
+    import pandas as pd
+    def load(name):
+        return np.load(os.path.join(cache_path, name + '.npy'), mmap_mode='r')
+
+    index = pd.DatetimeIndex(load('time'), name='time')
+    dimm = pd.DataFrame({name: load(name) for name in dimm_cache_dtypes},
+                        index=index)
+    dimm.attrs['night_log_r0'] = pd.Series(
+        load('night_log_r0'), index=load('night_log_r0_night_mjd'))
+    return dimm
+
+
+def load_config_dimm(config):
+    """Load the DIMM data named in a simsee configuration.
+
+    Args:
+        config: a configuration as returned by simsee.parse_simsee_config
+
+    Return:
+        a pandas.DataFrame with the data, as returned by simsee.load_dimm,
+        from the night of start_mjd through the first measurement after
+        end_mjd (offset by years_offset), so the seeing interpolated from
+        it is the same as from the whole file.
+    """
+    # Load every measurement in the nights simulated, and in the
+    # following night, as simsee.interpolate_seeing_arrays needs.
+    # Nights start and end within a day after the MJD that names them.
+    # The window is then widened until it includes a measurement after
+    # end_mjd (or the end of the file), so the data loaded always ends
+    # with the measurement that bounds the last gap, as when the whole
+    # file is read.
+    mjd_offset = int(round(year_length_days*config['years_offset']))
+    start_mjd = calc_night_mjd(config['start_mjd']) - mjd_offset
+    last_mjd = config['end_mjd'] - mjd_offset
+    days_after = 3
+    with profile_stage('dimm_load') as stage:
+        while True:
+            if days_after is None:
+                end_mjd = None
+            else:
+                end_mjd = calc_night_mjd(config['end_mjd']) + days_after \
+                    - mjd_offset
+            dimm = load_dimm(
+                config['dimm_fname'],
+                outer_scale=config['outer_scale'],
+                cache_dir=config.get('dimm_cache_dir'),
+                start_mjd=start_mjd, end_mjd=end_mjd)
+            if days_after is None \
+                    or (len(dimm) > 0 and dimm.mjd.values[-1] >= last_mjd):
+                break
+            days_after = days_after*4 if days_after < 1000 else None
+        stage.samples += len(dimm)
+    return dimm
+
+
 def year_cos(mjd, seasonal_phase, seasonal_amplitude):
     """Calculate the seasonal offset assuming a cos with a period of 1 year.
 
@@ -533,13 +2998,68 @@ def year_cos(mjd, seasonal_phase, seasonal_amplitude):
     return seasonal_amplitude * np.cos(angle)
 
 
-def parse_simsee_config(config_fname):
-    """Parse the simsee configuration file."""
+def iso_to_mjd(date_string):
+    """Convert an ISO 8601 date and time in UTC to an MJD.
+
+    Args:
+        date_string: the date (and time), e.g. 2022-01-01T00:00:00Z
+
+    Returns:
+        the modified Julian date
+
+    Times without a time zone are taken to be in UTC, as astropy.time
+    does. Strings that datetime.datetime.fromisoformat cannot parse
+    (including leap seconds) are passed to astropy.time.Time instead.
+    The result is identical to astropy's except on days that end in a
+    leap second, which astropy stretches to 86401 seconds; there they
+    differ by up to a second.
+
+    >>> iso_to_mjd('2022-01-01T00:00:00Z')
+    59580.0
+    >>> iso_to_mjd('2022-01-01 18:00')
+    59580.75
+    >>> iso_to_mjd('2022-01-01T00:00:00-06:00')
+    59580.25
+    """
+    date_string = date_string.strip()
+    if date_string.endswith('Z'):
+        date_string = date_string[:-1] + '+00:00'
+
+    try:
+        date_time = datetime.datetime.fromisoformat(date_string)
+    except ValueError:
+        import astropy.time
+        return astropy.time.Time(date_string).mjd
+
+    if date_time.tzinfo is not None:
+        date_time = date_time.astimezone(
+            datetime.timezone.utc).replace(tzinfo=None)
+
+    since_epoch = date_time - mjd_epoch
+    return since_epoch.days \
+        + (since_epoch.seconds + since_epoch.microseconds/1.0e6)/(24*60*60)
+
+
+def parse_simsee_config(config_fname, overrides=None):
+    """Parse the simsee configuration file.
+
+    Args:
+        config_fname: the name of the configuration file
+        overrides: a dictionary of values (as strings) that replace those
+            in the file, keyed by (section, option) tuples
+
+    Returns:
+        a dictionary of keyword arguments for simsee functions
+    """
     config = configparser.ConfigParser()
     config.read(config_fname)
+    for (section, option), value in (overrides or {}).items():
+        if not config.has_section(section):
+            config.add_section(section)
+        config.set(section, option, value)
     config_dict = {
-        'start_mjd': astropy.time.Time(config['simulation']['start_date']).mjd,
-        'end_mjd': astropy.time.Time(config['simulation']['end_date']).mjd,
+        'start_mjd': iso_to_mjd(config['simulation']['start_date']),
+        'end_mjd': iso_to_mjd(config['simulation']['end_date']),
         'freq': config.getint('simulation', 'freq'),
         'random_seed': config.getint('simulation', 'random_seed'),
         'outer_scale': config.getfloat('optics', 'outer_scale'),
@@ -551,17 +3071,70 @@ def parse_simsee_config(config_fname):
         'sample_coeff': config.getfloat('sample', 'coeff'),
         'sample_innovation': config.getfloat('sample', 'innovation')}
 
+    if config.has_option('simulation', 'max_sun_altitude'):
+        config_dict['max_sun_altitude'] = config.getfloat('simulation',
+                                                          'max_sun_altitude')
+
     try:
         dimm_fname = config.get('dimm', 'fname')
         years_offset = config.getint('dimm', 'years_offset')
         config_dict['dimm_fname'] = dimm_fname
         config_dict['years_offset'] = years_offset
+        if config.has_option('dimm', 'cache_dir'):
+            config_dict['dimm_cache_dir'] = config.get('dimm', 'cache_dir')
     except:
         pass
 
     return config_dict
 
 
+def parse_sweep_config(sweep_fname):
+    """Parse a file describing a sweep of configuration parameters.
+
+    Args:
+        sweep_fname: the name of the sweep file
+
+    Returns:
+        a list of (name, overrides) tuples, one for each variant, where
+        overrides is as in simsee.parse_simsee_config
+
+    Options are named for the section and option they override in the
+    base configuration, e.g. nightly.coeff. Each option in a [grid]
+    section has a comma separated list of values, and there is a
+    variant for every combination of them, named grid followed by its
+    values, e.g. grid_nightly.coeff=0.1_sample.coeff=0.7. Every other
+    section is a single variant, named for the section.
+    """
+    config = configparser.ConfigParser()
+    config.read(sweep_fname)
+
+    def config_key(name):
+        if '.' not in name:
+            raise ValueError("Sweep option {0} is not of the form "
+                             "section.option".format(name))
+        return tuple(name.split('.', 1))
+
+    variants = []
+    if config.has_section('grid'):
+        names = list(config['grid'])
+        keys = [config_key(name) for name in names]
+        values = [[value.strip() for value in config['grid'][name].split(',')]
+                  for name in names]
+        for combination in itertools.product(*values):
+            variant_name = '_'.join(
+                ['grid'] + ['{0}={1}'.format(name, value)
+                            for name, value in zip(names, combination)])
+            variants.append((variant_name, dict(zip(keys, combination))))
+
+    for section in config.sections():
+        if section != 'grid':
+            variants.append((section,
+                             {config_key(name): value
+                              for name, value in config[section].items()}))
+
+    return variants
+
+
 if __name__ == '__main__':
     status = main()
     sys.exit(status)